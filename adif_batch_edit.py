@@ -1,31 +1,281 @@
-from hamutils.adif.adi import ADIReader, ADIWriter
+from hamutils.adif.adi import ParseErrorIncData
+from hamutils.adif.common import ParseError, adif_field, convert_freq_to_band
 
 import argparse
-import functools
+import collections
+import concurrent.futures
+import datetime
+import io
+import itertools
+import mmap
+import os
+import re
 import sys
 
+from adifstream import ADIStreamReader, ADIStreamWriter
+from timings import NO_TIMINGS, add_timing_arguments, instrument
+
+
+def _as_text(value):
+    # a record value as it would appear in the ADIF file
+    if isinstance(value, bool):
+        return 'Y' if value else 'N'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime('%Y%m%d')
+    if isinstance(value, datetime.time):
+        return value.strftime('%H%M%S')
+    return str(value)
+
+
+def _as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 
 class ADIFBatchEdit:
-    @staticmethod
-    def _open_adif_to_write(output_file):
-        return ADIWriter(output_file, "adif_batch_edit", "0.1", compact=True)
+    EOH_RE = re.compile(rb"<eoh[:>]", re.IGNORECASE)
+    EOR_RE = re.compile(rb"<eor[:>]", re.IGNORECASE)
+    CHUNK_SIZE = 8 << 20
 
     @staticmethod
-    def _add_field(fieldname, value, record):
-        record.setdefault(fieldname.lower(), value)
+    def _open_adif_to_write(output_file, header=True):
+        return ADIStreamWriter(output_file, "adif_batch_edit", "0.1", compact=True, header=header)
 
     @staticmethod
-    def _update_field(fieldname, value, record):
-        record[fieldname.lower()] = value
+    def _tag_end(data, regex, start):
+        m = regex.search(data, start)
+        if m is None:
+            return len(data)
+        end = data.find(b">", m.start())
+        return len(data) if end < 0 else end + 1
+
+    @classmethod
+    def _find_chunks(cls, path, chunk_size):
+        # Split the records after the header just past <eor> tags. A literal
+        # "<eor>" inside field data would be taken for a boundary; ADIF's
+        # length-prefixed fields allow that, but logging programs don't write it.
+        # A file without <eoh> fails like it does in ADIStreamReader.
+        chunks = []
+        if os.path.getsize(path) == 0:
+            raise ParseErrorIncData(1)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if cls.EOH_RE.search(data) is None:
+                # the line the reader gives up on, just past the last tag
+                raise ParseErrorIncData(data[:data.rfind(b">") + 1].count(b"\n") + 1)
+            start = cls._tag_end(data, cls.EOH_RE, 0)
+            while start < len(data):
+                end = len(data)
+                if start + chunk_size < len(data):
+                    end = cls._tag_end(data, cls.EOR_RE, start + chunk_size)
+                chunks.append((start, end))
+                start = end
+        return chunks
 
     @staticmethod
-    def _delete_field(fieldname, record):
-        record.pop(fieldname.lower())
+    def _edit_chunk(ops, path, encoding, start, end):
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        edit = ADIFBatchEdit.compile_operations(ops)
+        output = io.BytesIO()
+        writer = ADIFBatchEdit._open_adif_to_write(output, header=False)
+        # same newline translation as the text mode file in a serial run
+        reader = ADIStreamReader(io.TextIOWrapper(io.BytesIO(data), encoding), header=False)
+        count = 0
+        try:
+            for record in reader:
+                edit(record)
+                writer.add_qso(**record)
+                count += 1
+        except ParseError as ex:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as whole:
+                ex.line += whole[:start].count(b"\n")
+            raise
+        return output.getvalue(), reader.lotw_eof, count
+
+    CONDITION_RE = re.compile(r"^(!?)(\w+)(?:(=|!=|<=|>=|<|>)(.*))?$")
+    VALUE_RE = re.compile(r"^(\w+)(?:\((\w+)\))?$")
+    FUNCTIONS = {
+        "band": lambda value: convert_freq_to_band(float(value)),
+        "upper": lambda value: _as_text(value).upper(),
+        "lower": lambda value: _as_text(value).lower(),
+    }
+    COMPARISONS = {
+        "<": lambda a, b: a < b,
+        ">": lambda a, b: a > b,
+        "<=": lambda a, b: a <= b,
+        ">=": lambda a, b: a >= b,
+    }
 
     @staticmethod
-    def _keep_fields(fields, record):
-        for key in set(record.keys()).difference(fields):
-            record.pop(key)
+    def _compile_getter(fieldname):
+        # the reader folds qso_date/time_on (and the _off pair) into datetimes
+        match fieldname:
+            case "qso_date" | "time_on" | "qso_date_off" | "time_off":
+                source = "datetime_on" if fieldname in ("qso_date", "time_on") else "datetime_off"
+                part = datetime.datetime.date if fieldname.startswith("qso_date") else datetime.datetime.time
+
+                def get(record):
+                    value = record.get(source)
+                    return None if value is None else part(value)
+                return get
+            case _:
+                return lambda record: record.get(fieldname)
+
+    @classmethod
+    def _compile_value(cls, value):
+        # the right hand side of "field:=value": "other" copies another field
+        # and "func(other)" computes from one, returning None (the field is
+        # left alone) if the source is missing
+        m = cls.VALUE_RE.match(value)
+        if m is None:
+            raise RuntimeError(f"Invalid computed value: {value}")
+
+        name, argument = m.groups()
+        if argument is None:
+            return cls._compile_getter(name.lower())
+        if name.lower() not in cls.FUNCTIONS:
+            raise RuntimeError(f"Invalid function: {name}")
+        function = cls.FUNCTIONS[name.lower()]
+        get = cls._compile_getter(argument.lower())
+
+        def compute(record):
+            source = get(record)
+            return None if source is None else function(source)
+        return compute
+
+    @classmethod
+    def _parse_condition(cls, condition):
+        m = cls.CONDITION_RE.match(condition)
+        if m is None or (m.group(1) and m.group(3)):
+            raise RuntimeError(f"Invalid condition: {condition}")
+        negate, fieldname, operator, expected = m.groups()
+        if expected is not None and ".." in expected:
+            low, high = (_as_number(bound) for bound in expected.split("..", 1))
+            if operator != "=" or low is None or high is None:
+                raise RuntimeError(f"Invalid range: {condition}")
+        if expected is not None and adif_field.get(fieldname.lower()) == "T":
+            if not all(len(time) in (4, 6) and time.isdigit() for time in expected.split("..", 1)):
+                raise RuntimeError(f"Invalid time, expected HHMM or HHMMSS: {condition}")
+        return bool(negate), fieldname.lower(), operator, expected
+
+    @classmethod
+    def _compile_condition(cls, condition):
+        negate, fieldname, operator, expected = condition
+        get = cls._compile_getter(fieldname)
+
+        if operator is None:
+            if negate:
+                return lambda record: get(record) is None
+            return lambda record: get(record) is not None
+
+        if adif_field.get(fieldname) == "T":
+            return cls._compile_time_condition(get, operator, expected)
+
+        if ".." in expected:
+            low, high = (float(bound) for bound in expected.split("..", 1))
+
+            def in_range(record):
+                value = _as_number(get(record))
+                return value is not None and low <= value <= high
+            return in_range
+
+        if operator in ("=", "!="):
+            number = _as_number(expected)
+            text = expected.upper()
+
+            def equals(record):
+                value = get(record)
+                if value is None:
+                    return False
+                if isinstance(value, float) and number is not None:
+                    return value == number
+                return _as_text(value).upper() == text
+
+            if operator == "!=":
+                return lambda record: not equals(record)
+            return equals
+
+        compare = cls.COMPARISONS[operator]
+        number = _as_number(expected)
+        text = expected.upper()
+
+        def ordered(record):
+            value = get(record)
+            if value is None:
+                return False
+            if number is not None and (value_number := _as_number(value)) is not None:
+                return compare(value_number, number)
+            return compare(_as_text(value).upper(), text)
+        return ordered
+
+    @classmethod
+    def _compile_time_condition(cls, get, operator, expected):
+        # Times are compared as HHMMSS text cut to the length of the operand,
+        # so an HHMM operand stands for every second of that minute.
+        def text(record, width):
+            value = get(record)
+            return None if value is None else _as_text(value)[:width]
+
+        if ".." in expected:
+            low, high = expected.split("..", 1)
+
+            def in_range(record):
+                start, end = text(record, len(low)), text(record, len(high))
+                return start is not None and low <= start and end <= high
+            return in_range
+
+        compare = cls.COMPARISONS.get(operator, lambda a, b: a == b)
+        width = len(expected)
+
+        def matches(record):
+            value = text(record, width)
+            return value is not None and compare(value, expected)
+
+        if operator == "!=":
+            return lambda record: not matches(record)
+        return matches
+
+    @classmethod
+    def _compile_step(cls, kind, ops):
+        # ops is a run of consecutive (kind, fieldname, value) operations
+        match kind:
+            case "add":
+                defaults = {}
+                for _, fieldname, value in ops:
+                    defaults.setdefault(fieldname, value)
+                defaults = tuple(defaults.items())
+                return lambda record: record.update({key: value for key, value in defaults if key not in record})
+            case "update":
+                updates = {fieldname: value for _, fieldname, value in ops}
+                return lambda record: record.update(updates)
+            case "add_computed" | "update_computed":
+                computed = tuple((fieldname, cls._compile_value(value)) for _, fieldname, value in ops)
+                overwrite = kind == "update_computed"
+
+                def set_computed(record):
+                    for key, compute in computed:
+                        if overwrite or key not in record:
+                            value = compute(record)
+                            if value is not None:
+                                record[key] = value
+                return set_computed
+            case "delete":
+                fieldnames = tuple(fieldname for _, fieldname, _ in ops)
+
+                def delete(record):
+                    for key in fieldnames:
+                        del record[key]
+                return delete
+            case "keep":
+                fieldnames = frozenset.intersection(*(fieldnames for _, fieldnames, _ in ops))
+
+                def keep(record):
+                    for key in [key for key in record if key not in fieldnames]:
+                        del record[key]
+                return keep
 
     def __init__(self, input_file, output_file):
         self._input_file = input_file
@@ -36,31 +286,123 @@ class ADIFBatchEdit:
         op, *fields = op_string.split(sep)
 
         match op.lower():
-            case "add":
+            case "add" | "update":
                 for field in fields:
                     fieldname, value = field.split("=", 1)
-                    self._ops.append(functools.partial(ADIFBatchEdit._add_field, fieldname, value))
-            case "update":
-                for field in fields:
-                    fieldname, value = field.split("=", 1)
-                    self._ops.append(functools.partial(ADIFBatchEdit._update_field, fieldname, value))
+                    if fieldname.endswith(":"):
+                        # "field:=value" computes the value, "field=value" is always a constant
+                        self._compile_value(value)
+                        self._ops.append((f"{op.lower()}_computed", fieldname[:-1].lower(), value))
+                    else:
+                        self._ops.append((op.lower(), fieldname.lower(), value))
             case "delete":
                 for field in fields:
-                    self._ops.append(functools.partial(ADIFBatchEdit._delete_field, field))
+                    self._ops.append(("delete", field.lower(), None))
             case "keep":
-                self._ops.append(functools.partial(ADIFBatchEdit._keep_fields, fields))
+                self._ops.append(("keep", frozenset(field.lower() for field in fields), None))
+            case "where":
+                # following operations only apply to matching records, until
+                # the next where or end
+                self._ops.append(("where", tuple(self._parse_condition(field) for field in fields), None))
+            case "end":
+                self._ops.append(("end", None, None))
             case _:
                 raise RuntimeError(f"Invalid operation: {op_string}")
 
-    def run_batch(self):
+    def compile(self):
+        return self.compile_operations(self._ops)
+
+    @staticmethod
+    def _chain(steps):
+        if len(steps) == 1:
+            return steps[0]
+
+        def apply(record):
+            for step in steps:
+                step(record)
+        return apply
+
+    @classmethod
+    def compile_operations(cls, ops):
+        # Runs of the same operation become a single step: one dict merge
+        # for adds or updates, a precomputed key tuple for deletes and the
+        # intersection of the key sets for keeps. Each where section becomes
+        # one step guarded by its precompiled predicates.
+        sections = [(None, [])]
+        for op in ops:
+            if op[0] == "where":
+                sections.append((op[1], []))
+            elif op[0] == "end":
+                sections.append((None, []))
+            else:
+                sections[-1][1].append(op)
+
+        steps = []
+        for conditions, section_ops in sections:
+            if not section_ops:
+                continue
+            body = cls._chain([cls._compile_step(kind, list(run)) for kind, run in itertools.groupby(section_ops, key=lambda op: op[0])])
+            if conditions is None:
+                steps.append(body)
+                continue
+
+            predicates = tuple(cls._compile_condition(condition) for condition in conditions)
+
+            def conditional(record, body=body, predicates=predicates):
+                for predicate in predicates:
+                    if not predicate(record):
+                        return
+                body(record)
+            steps.append(conditional)
+
+        if not steps:
+            return lambda record: None
+        return cls._chain(steps)
+
+    def _edit_chunks(self, chunks, path, encoding, jobs):
+        # edited chunks in file order, with a bounded number in flight
+        executor = concurrent.futures.ProcessPoolExecutor(jobs)
+        try:
+            pending = collections.deque()
+            for start, end in chunks:
+                pending.append(executor.submit(self._edit_chunk, self._ops, path, encoding, start, end))
+                if len(pending) > 2 * jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def run_batch_parallel(self, jobs, timings=NO_TIMINGS):
+        # the workers read, edit and format; "edit" is the time spent
+        # waiting for them
         with self._input_file as input_file, self._output_file as output_file:
-            reader = ADIReader(input_file)
-            writer = self._open_adif_to_write(self._output_file)
+            chunks = self._find_chunks(input_file.name, self.CHUNK_SIZE)
+            writer = self._open_adif_to_write(output_file)
             writer.write_header()
-            for record in reader:
-                for op in self._ops:
-                    op(record)
-                writer.add_qso(**record)
+            write = timings.wrap("write", output_file.write)
+            edited = self._edit_chunks(chunks, input_file.name, input_file.encoding, jobs)
+            for records, lotw_eof, count in timings.iterate("edit", edited, "chunks"):
+                write(records)
+                timings.count("records", count)
+                if lotw_eof:
+                    break
+
+    def run_batch(self, jobs=1, timings=NO_TIMINGS):
+        if jobs > 1 and os.path.isfile(getattr(self._input_file, "name", "")):
+            return self.run_batch_parallel(jobs, timings)
+
+        with timings.stage("compile"):
+            edit = self.compile()
+        with self._input_file as input_file, self._output_file as output_file:
+            reader = ADIStreamReader(input_file)
+            writer = self._open_adif_to_write(output_file)
+            writer.write_header()
+            edit = timings.wrap("edit", edit)
+            add_qso = timings.wrap("write", writer.add_qso)
+            for record in timings.iterate("read", reader, "records"):
+                edit(record)
+                add_qso(**record)
 
 
 if __name__ == '__main__':
@@ -69,6 +411,8 @@ if __name__ == '__main__':
     parser.add_argument("-f", "--input-file", type=argparse.FileType("r"), default=sys.stdin)
     parser.add_argument("-o", "--output-file", type=argparse.FileType("wb"), default=sys.stdout.buffer)
     parser.add_argument("--seperator", default="|")
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    add_timing_arguments(parser)
 
     parser.add_argument("operations", nargs="+")
 
@@ -79,4 +423,5 @@ if __name__ == '__main__':
     for operation in args.operations:
         editor.add_operations(operation, args.seperator)
 
-    editor.run_batch()
+    with instrument(args) as timings:
+        editor.run_batch(args.jobs, timings)
@@ -0,0 +1,218 @@
+import datetime
+import re
+
+from hamutils.adif.adi import ADIWriter, ParseErrorIncData
+from hamutils.adif.common import ParseError, WriteError, adif_field, convert_field, convert_freq_to_band
+
+
+class ADIStreamReader:
+    # Produces the same records as hamutils' ADIReader, but reads the input
+    # in blocks and finds field tags with a regex instead of a per-character
+    # state machine. Memory is bounded by the block size plus one field.
+
+    TAG_RE = re.compile(r"<([^:>]*)(?::([^:>]*)(?::([^>]*))?)?>")
+    BLOCK_SIZE = 1 << 20
+
+    def __init__(self, flo, block_size=BLOCK_SIZE, header=True):
+        self._flo = flo
+        self._block_size = block_size
+        self._buf = ""
+        self._pos = 0
+        self._line_base = 1
+        self._eof = False
+        self.lotw_eof = False
+        if header:
+            tmp = self._readfield()
+            while tmp[0] != 'eoh':
+                tmp = self._readfield()
+
+    @property
+    def _line_num(self):
+        return self._line_base + self._buf.count("\n", 0, self._pos)
+
+    def _fill(self):
+        if self._eof:
+            raise ParseErrorIncData(self._line_num)
+        if self._pos > self._block_size:
+            self._line_base += self._buf.count("\n", 0, self._pos)
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        data = self._flo.read(self._block_size)
+        if not data:
+            self._eof = True
+            raise ParseErrorIncData(self._line_num)
+        self._buf += data
+
+    def _readfield(self):
+        # fast path for a complete <name:len> or <name:len:type> tag in the buffer
+        m = self.TAG_RE.search(self._buf, self._pos)
+        if m is not None:
+            f_name, f_len, f_type = m.groups()
+            if f_name and f_len and f_len.isdecimal():
+                f_len = int(f_len)
+                start = m.end()
+                end = start + f_len
+                if end <= len(self._buf):
+                    self._pos = end
+                    return f_name.lower(), self._buf[start:end], f_len, f_type or ''
+        return self._readfield_slow()
+
+    def _readfield_slow(self):
+        while True:
+            m = self.TAG_RE.search(self._buf, self._pos)
+            if m is None:
+                self._fill()
+                continue
+
+            f_name, f_len, f_type = m.groups()
+            f_name = f_name.lower()
+            if len(f_name) == 0:
+                self._pos = m.start()
+                raise ParseError(self._line_num, 'missing field name')
+            if f_len is None:
+                f_len, f_type = '', ''
+            else:
+                try:
+                    f_len = int(f_len)
+                except ValueError:
+                    self._pos = m.start()
+                    raise ParseError(self._line_num, 'invalid value for data length')
+            f_type = f_type or ''
+
+            start = m.end()
+            end = start + f_len if isinstance(f_len, int) and f_len > 0 else start
+            if end > len(self._buf):
+                self._fill()
+                continue
+            self._pos = end
+            return f_name, self._buf[start:end], f_len, f_type
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            tmp = self._readfield()
+        except ParseErrorIncData:
+            raise StopIteration
+        if tmp[0] == 'app_lotw_eof':
+            self.lotw_eof = True
+            raise StopIteration
+        res = {}
+        while tmp[0] != 'eor':
+            try:
+                res[tmp[0]] = convert_field(tmp[0], tmp[1], tmp[3])
+            except Exception:
+                raise ParseError(self._line_num, 'invalid value for \'%s\'' % tmp[0])
+            tmp = self._readfield()
+        if 'qso_date' not in res:
+            raise ParseError(self._line_num, 'missing qso_date field')
+        if 'time_on' not in res:
+            raise ParseError(self._line_num, 'missing time_on field')
+        if 'call' not in res:
+            raise ParseError(self._line_num, 'missing call field')
+        if 'band' not in res:
+            if 'freq' in res:
+                tmpband = convert_freq_to_band(res['freq'])
+                if tmpband:
+                    res['band'] = tmpband
+                else:
+                    raise ParseError(self._line_num, 'error in freq to band conversion')
+            else:
+                raise ParseError(self._line_num, 'missing band field')
+        if 'mode' not in res:
+            raise ParseError(self._line_num, 'missing mode field')
+
+        res['datetime_on'] = datetime.datetime.combine(res['qso_date'], res['time_on'])
+        if 'time_off' in res:
+            if 'qso_date_off' in res:
+                res['datetime_off'] = datetime.datetime.combine(res['qso_date_off'], res['time_off'])
+                del res['qso_date_off']
+            else:
+                res['datetime_off'] = datetime.datetime.combine(res['qso_date'], res['time_off'])
+            del res['time_off']
+        del res['time_on']
+        del res['qso_date']
+        return res
+
+
+class ADIStreamWriter(ADIWriter):
+    # Writes the same bytes as hamutils' ADIWriter, but builds each record
+    # with one write call and skips unidecode for plain ASCII fields, where
+    # it is a no-op anyway.
+
+    REQUIRED_FIELDS = ('qso_date', 'time_on', 'call', 'band', 'mode')
+
+    def __init__(self, *args, header=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        # records only, e.g. for a chunk appended behind another writer's header
+        self._head_writed = not header
+
+    def _format_field(self, field, data):
+        l_field = field.lower()
+        field_type = adif_field.get(l_field)
+        if field_type == 'D':
+            data = data.strftime('%Y%m%d')
+        elif field_type == 'T':
+            data = data.strftime('%H%M%S')
+        elif field_type == 'B':
+            data = 'Y' if data else 'N'
+        elif field_type is not None or l_field.startswith('app_'):
+            data = str(data)
+        else:
+            raise WriteError('unknown field: \'%s\'' % l_field)
+        return self._write_field(l_field, data)
+
+    def add_qso(self, **kw):
+        if not self._head_writed:
+            self.write_header()
+
+        parts = []
+        separator = b'' if self._compact else self._newline
+        if not self._compact:
+            parts.append(self._newline)
+
+        if 'datetime_on' in kw:
+            tmp = kw.pop('datetime_on')
+            kw['qso_date'] = tmp.date()
+            kw['time_on'] = tmp.time()
+        if 'datetime_off' in kw:
+            tmp = kw.pop('datetime_off')
+            t_date = tmp.date()
+            if t_date != kw['qso_date']:
+                kw['qso_date_off'] = t_date
+            elif 'qso_date_off' in kw:
+                del kw['qso_date_off']
+            kw['time_off'] = tmp.time()
+
+        for field in self.REQUIRED_FIELDS:
+            if not kw.get(field):
+                raise WriteError('missing field: \'%s\'' % field)
+            parts.append(self._format_field(field, kw.pop(field)))
+            parts.append(separator)
+
+        for field, data in kw.items():
+            if data is not None:
+                parts.append(self._format_field(field, data))
+                parts.append(separator)
+        parts.append(self._write_field('eor', None))
+        parts.append(self._newline)
+        self._flo.write(b''.join(parts))
+
+    @staticmethod
+    def _write_field(name, data, data_type=None):
+        if data:
+            data = str(data)
+            if '\n' in data:
+                data = data.replace('\r\n', '\n').replace('\n', '\r\n')
+            if not data.isascii():
+                return ADIWriter._write_field(name, data, data_type)
+            if data_type:
+                raw = '<%s:%d:%s>%s' % (name.lower(), len(data), data_type, data)
+            else:
+                raw = '<%s:%d>%s' % (name.lower(), len(data), data)
+        else:
+            raw = '<%s:0>' % name.lower()
+        if not raw.isascii():
+            return ADIWriter._write_field(name, data, data_type)
+        return raw.encode('ascii')
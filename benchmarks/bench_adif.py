@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+import time
+
+from hamutils.adif.adi import ADIReader
+
+from adif_batch_edit import ADIFBatchEdit
+from adifstream import ADIStreamReader
+from benchmarks.generate import write_adif
+
+
+def time_reader(path, reader_class):
+    with open(path) as f:
+        start = time.perf_counter()
+        count = sum(1 for _ in reader_class(f))
+    return count / (time.perf_counter() - start)
+
+
+def time_batch(path, operations, jobs=1):
+    editor = ADIFBatchEdit(open(path), open(os.devnull, "wb"))
+    for operation in operations:
+        editor.add_operations(operation)
+    with open(path) as f:
+        count = sum(1 for _ in ADIStreamReader(f))
+    start = time.perf_counter()
+    editor.run_batch(jobs)
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=50000)
+    parser.add_argument("-j", "--jobs", type=int, default=[1], nargs="+")
+    parser.add_argument("operations", nargs="*", default=["update|operator=N4XX", "delete|contest_id", "add|my_state=SC"])
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".adi", delete=False) as f:
+        write_adif(f, args.count)
+    try:
+        print(f"{'stage':<24} {'records/s':>10}")
+        print(f"{'ADIReader':<24} {time_reader(f.name, ADIReader):>10.0f}")
+        print(f"{'ADIStreamReader':<24} {time_reader(f.name, ADIStreamReader):>10.0f}")
+        for jobs in args.jobs:
+            print(f"{f'run_batch --jobs {jobs}':<24} {time_batch(f.name, args.operations, jobs):>10.0f}")
+    finally:
+        os.unlink(f.name)
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+import hamqsladdr
+from benchmarks.mock_qsl_server import MockQSLServer
+from timings import NO_TIMINGS, add_timing_arguments, instrument
+
+
+def make_callsigns(count):
+    return [f"K{i % 10}{chr(65 + i // 10 % 26)}{chr(65 + i // 260 % 26)}{chr(65 + i // 6760 % 26)}" for i in range(count)]
+
+
+async def time_lookups(server, service, callsigns, concurrency, rate=None, timings=NO_TIMINGS):
+    svc = getattr(hamqsladdr, service)("user", "passwd")
+    svc.xmlurl = server.url(service)
+    svc.timings = timings
+    server.peak_active = 0
+    async with aiohttp.ClientSession() as client_session:
+        await svc.login(client_session)
+        start = time.perf_counter()
+        results = [item async for item in hamqsladdr.lookup_all(svc, client_session, callsigns, concurrency, rate)]
+        elapsed = time.perf_counter() - start
+
+    if [callsign for callsign, _ in results] != callsigns:
+        raise RuntimeError("Results out of order")
+    failed = sum(isinstance(result, RuntimeError) for _, result in results)
+    timings.count("lookups", len(results))
+    timings.count("failed", failed)
+    return elapsed, failed
+
+
+async def main(args, timings=NO_TIMINGS):
+    server = MockQSLServer(args.latency)
+    await server.start()
+    try:
+        callsigns = make_callsigns(args.count)
+        print(f"{'service':<8} {'concurrency':>11} {'rate':>6} {'seconds':>8} {'lookups/s':>10} {'peak':>5} {'failed':>6}")
+        for service in args.service:
+            for concurrency in args.concurrency:
+                elapsed, failed = await time_lookups(server, service, callsigns, concurrency, args.rate, timings)
+                print(f"{service:<8} {concurrency:>11} {args.rate or '-':>6} {elapsed:>8.2f} {len(callsigns) / elapsed:>10.0f} "
+                      f"{server.peak_active:>5} {failed:>6}")
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=[1, 8, 32], nargs="+")
+    parser.add_argument("-r", "--rate", type=float)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("-s", "--service", default=["QRZ", "HamQTH"], nargs="+", choices=["QRZ", "HamQTH"])
+    add_timing_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument(args) as timings:
+        asyncio.run(main(args, timings))
@@ -0,0 +1,41 @@
+import argparse
+import random
+import time
+
+from benchmarks.generate import ADIF_MODES, make_qsos
+from simplelogger import QSOIndex
+
+
+def make_records(count, seed=0):
+    # the fields QSOIndex reads from a generated log's records
+    return [{"call": call, "band": band, "mode": ADIF_MODES[mode]}
+            for band, _, mode, _, _, _, _, call, _, _ in make_qsos(count, seed)]
+
+
+def per_call(function, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        function(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=100000)
+    parser.add_argument("-q", "--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    records = make_records(args.count)
+    start = time.perf_counter()
+    index = QSOIndex.from_records(records)
+    print(f"build {len(records)} QSOs, {len(index)} calls: {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(1)
+    queries = [(r["call"], r["band"], r["mode"]) for r in rng.sample(records, args.queries)]
+    fragments = [(call[i:i + 3],) for call, _, _ in queries for i in (rng.randrange(max(1, len(call) - 2)),)]
+    new = [(call + "/P", band, mode) for call, band, mode in queries[:1000]]
+    print(f"{'operation':<10} {'us/call':>8}")
+    print(f"{'is_dupe':<10} {per_call(index.is_dupe, queries):>8.2f}")
+    print(f"{'worked':<10} {per_call(index.worked, [q[:1] for q in queries]):>8.2f}")
+    print(f"{'partial':<10} {per_call(index.partial, fragments):>8.2f}")
+    print(f"{'add new':<10} {per_call(index.add, new):>8.2f}")
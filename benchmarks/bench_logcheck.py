@@ -0,0 +1,67 @@
+import argparse
+import collections
+import random
+import time
+
+from benchmarks.generate import make_qsos, make_stations
+from logcheck import LogChecker, Status
+from qsorecord import QSO, to_epoch
+from scqpscore import Mode
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def make_logs(stations, qsos, seed=0):
+    # Each station works its share of the pool and every contact is logged by
+    # both sides, then a few percent are damaged: dropped from one log, busted
+    # call or busted exchange.
+    rng = random.Random(seed)
+    pool = make_stations(stations, seed)
+    exchanges = dict(pool)
+
+    logs = []
+    expected = collections.Counter()
+    for i, (a, exchange) in enumerate(pool):
+        for band, freq, mode, timestamp, _, rst_s, stx, b, rst_r, srx in make_qsos(
+                max(1, qsos // 2 // stations), seed + i, a, exchange, pool):
+            if b == a:
+                continue
+            mode, timestamp = Mode[mode], to_epoch(timestamp)
+            qso_a = QSO(band, mode, timestamp, a, rst_s, stx, b, rst_r, srx, freq)
+            qso_b = QSO(band, mode, timestamp + 60 * rng.randint(-1, 1), b, rst_r, srx, a, rst_s, stx, freq)
+            damage = rng.random()
+            if damage < 0.01:
+                qso_b = None
+                expected[Status.NOT_IN_LOG] += 1
+            elif damage < 0.02:
+                busted = b[:-1] + rng.choice(LETTERS.replace(b[-1], ""))
+                if busted not in exchanges:
+                    qso_a = qso_a.replace(callsign=busted)
+                    expected[Status.BUSTED_CALL] += 1
+                    # and b's QSO is not in a's log
+                    expected[Status.NOT_IN_LOG] += 1
+            elif damage < 0.03:
+                qso_a = qso_a.replace(srx="ON" if srx == "DX" else "DX")
+                expected[Status.BUSTED_EXCHANGE] += 1
+            logs.append(qso_a)
+            if qso_b is not None:
+                logs.append(qso_b)
+    return logs, expected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--stations", type=int, default=500)
+    parser.add_argument("-n", "--counts", nargs="+", type=int, default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'QSOs':>10} {'check (s)':>10} {'QSOs/s':>10}  findings (expected)")
+    for count in args.counts:
+        qsos, expected = make_logs(args.stations, count)
+        checker = LogChecker()
+        checker.add_qsos(qsos)
+        start = time.perf_counter()
+        found = collections.Counter(result.status for result in checker.check())
+        elapsed = time.perf_counter() - start
+        findings = ", ".join(f"{status.name} {found[status]} ({expected[status]})" for status in expected)
+        print(f"{len(qsos):>10} {elapsed:>10.2f} {len(qsos) / elapsed:>10.0f}  {findings}")
@@ -0,0 +1,38 @@
+import argparse
+import contextlib
+import io
+import time
+
+from benchmarks.generate import write_cabrillo
+from scqpscore import parse_qso_line, parse_qso_line_regex, parse_qsos
+
+
+def make_lines(count, seed=0):
+    # the QSO lines of a generated log
+    f = io.StringIO()
+    write_cabrillo(f, count, seed)
+    return [line for line in f.getvalue().splitlines(keepends=True) if line.startswith("QSO:")]
+
+
+def bench(lines, parse_line):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        qsos = list(parse_qsos(lines, parse_line=parse_line))
+        elapsed = time.perf_counter() - start
+    return qsos, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=200000)
+    args = parser.parse_args()
+
+    lines = make_lines(args.count)
+    regex_qsos, regex_time = bench(lines, parse_qso_line_regex)
+    fast_qsos, fast_time = bench(lines, parse_qso_line)
+    if regex_qsos != fast_qsos:
+        raise RuntimeError("Parsers disagree")
+
+    print(f"{'parser':>8} {'lines/s':>12}")
+    print(f"{'regex':>8} {len(lines) / regex_time:>12.0f}")
+    print(f"{'fast':>8} {len(lines) / fast_time:>12.0f}")
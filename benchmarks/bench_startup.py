@@ -0,0 +1,41 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_parse import make_lines
+
+
+def run(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-n", "--count", type=int, default=300)
+    args = parser.parse_args()
+
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scqpscore.py")
+    with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as log:
+        log.writelines(make_lines(args.count))
+    try:
+        cases = {
+            "interpreter": [sys.executable, "-c", "pass"],
+            "--help": [sys.executable, script, "--help"],
+            "--report plain": [sys.executable, script, "-f", log.name, "--report", "plain"],
+            "--report pandas": [sys.executable, script, "-f", log.name],
+        }
+        print(f"{'command':<18} {'median (s)':>10}")
+        for name, command in cases.items():
+            print(f"{name:<18} {run(command, args.repeat):>10.3f}")
+    finally:
+        os.unlink(log.name)
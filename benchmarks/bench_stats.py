@@ -0,0 +1,33 @@
+import argparse
+import time
+
+from benchmarks.generate import make_qsos
+from qsorecord import to_epoch
+from scqpscore import Mode, QSO, StatsKeeper
+
+
+def bench(count):
+    qsos = [QSO(band, Mode[mode], to_epoch(timestamp), station, rst_s, stx, callsign, rst_r, srx, freq)
+            for band, freq, mode, timestamp, station, rst_s, stx, callsign, rst_r, srx in make_qsos(count)]
+    stats = StatsKeeper()
+    start = time.perf_counter()
+    for qso in qsos:
+        stats.record(qso)
+    recorded = time.perf_counter()
+    stats.process()
+    processed = time.perf_counter()
+    return recorded - start, processed - recorded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--counts", nargs="+", type=int, default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    # StatsKeeper imports pandas lazily, keep that out of the first timing
+    import pandas
+
+    print(f"{'QSOs':>10} {'record (s)':>12} {'process (s)':>12} {'QSOs/s':>12}")
+    for count in args.counts:
+        record_time, process_time = bench(count)
+        print(f"{count:>10} {record_time:>12.3f} {process_time:>12.3f} {count / (record_time + process_time):>12.0f}")
@@ -0,0 +1,82 @@
+import argparse
+import os
+import time
+import xml.etree.ElementTree as ET
+
+from hamqsladdr import QRZ, HamQTH
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def tree_qrz(data):
+    # the lookup as it was done before the streaming parser
+    xmlns = {'ns': 'http://xmldata.qrz.com'}
+    result = ET.fromstring(data)
+    if result.find('ns:Session/ns:Error', xmlns) is not None:
+        raise RuntimeError()
+    addr = {}
+    fname = result.find('ns:Callsign/ns:fname', xmlns).text
+    lname = result.find('ns:Callsign/ns:name', xmlns).text
+    addr['name'] = f'{fname} {lname}'
+    addr['street'] = result.find('ns:Callsign/ns:addr1', xmlns).text
+    addr['city'] = result.find('ns:Callsign/ns:addr2', xmlns).text
+    addr['zip'] = result.find('ns:Callsign/ns:zip', xmlns).text
+    addr['country'] = result.find('ns:Callsign/ns:country', xmlns).text
+    addr['state'] = result.find('ns:Callsign/ns:state', xmlns).text
+    return addr
+
+
+def tree_hamqth(data):
+    xmlns = {'ns': 'https://www.hamqth.com'}
+    result = ET.fromstring(data)
+    if result.find('ns:session/ns:error', xmlns) is not None:
+        raise RuntimeError()
+    addr = {}
+    for elmt in list(result.find('ns:search', xmlns)):
+        if elmt.tag == '{https://www.hamqth.com}adr_name':
+            addr['name'] = elmt.text
+        elif elmt.tag == '{https://www.hamqth.com}adr_street1':
+            addr['street'] = elmt.text
+        elif elmt.tag == '{https://www.hamqth.com}adr_city':
+            addr['city'] = elmt.text
+        elif elmt.tag == '{https://www.hamqth.com}adr_zip':
+            addr['zip'] = elmt.text
+        elif elmt.tag == '{https://www.hamqth.com}adr_country':
+            addr['country'] = elmt.text
+        elif elmt.tag == '{https://www.hamqth.com}us_state':
+            addr['state'] = elmt.text
+    return addr
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def rate(function, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"{'service':<8} {'parser':<26} {'lookups/s':>10}")
+    for svc, fixture, tree_parse in ((QRZ("user", "passwd"), "qrz_lookup.xml", tree_qrz),
+                                     (HamQTH("user", "passwd"), "hamqth_lookup.xml", tree_hamqth)):
+        with open(os.path.join(FIXTURES, fixture), "rb") as f:
+            data = f.read()
+        split = chunks(data, args.chunk_size)
+        if tree_parse(data) != svc.address(svc.parse([data])[1]):
+            raise RuntimeError(f"{fixture}: parsers disagree")
+
+        name = type(svc).__name__
+        print(f"{name:<8} {'fromstring + find':<26} {rate(lambda: tree_parse(data), args.count):>10.0f}")
+        print(f"{name:<8} {'incremental':<26} {rate(lambda: svc.address(svc.parse([data])[1]), args.count):>10.0f}")
+        print(f"{name:<8} {f'incremental, {args.chunk_size}B chunks':<26} "
+              f"{rate(lambda: svc.address(svc.parse(split)[1]), args.count):>10.0f}")
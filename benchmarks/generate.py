@@ -0,0 +1,150 @@
+import argparse
+import datetime
+import itertools
+import random
+import sys
+
+from scqpscore import BANDS, BONUS_STATIONS, CANADIAN_PROVINCES, END_TIME, SC_COUNTIES, START_TIME, US_STATES
+
+# Synthetic SC QSO Party logs with the shape of real ones: a pool of
+# stations in SC, the rest of the US, Canada and DX, a few of them busy
+# and most heard once or twice; 40m and 20m carrying most contacts; CW and
+# phone in their band segments with some digital near the FT8 watering
+# holes; and QSOs spread through the contest period in time order. The
+# same seed gives the same log.
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+BAND_WEIGHTS = {"160m": 2, "80m": 10, "40m": 35, "20m": 33, "15m": 11, "10m": 7, "6m": 2}
+MODE_WEIGHTS = {"CW": 45, "PH": 45, "DG": 10}
+# share of the station pool by where the station is
+LOCATION_WEIGHTS = {"sc": 30, "us": 62, "ca": 5, "dx": 3}
+# rough relative activity of states, the neighbours and big states work the party most
+STATE_WEIGHTS = {state: 1 for state in US_STATES} | {"NC": 12, "GA": 10, "FL": 6, "VA": 5, "TN": 5, "TX": 4, "CA": 4,
+                                                     "NY": 4, "OH": 4, "PA": 4}
+DX_PREFIXES = ["G", "DL", "F", "EA", "I", "JA", "ON", "PA", "OH", "SM", "LU", "PY", "VK", "ZL", "CT", "HA", "OK", "S5"]
+# kHz of the FT8 frequencies
+DIGITAL_FREQUENCIES = {"160m": 1840, "80m": 3573, "40m": 7074, "20m": 14074, "15m": 21074, "10m": 28074, "6m": 50313}
+ADIF_MODES = {"CW": "CW", "PH": "SSB", "DG": "FT8"}
+
+BAND_EDGES = {band: edges for edges, band in BANDS.items()}
+
+
+def us_call(rng, district):
+    prefix = rng.choice(["K", "N", "W", "K", "N", "W", "A" + rng.choice("ABCDEFGHIJKL"), "K" + rng.choice(LETTERS),
+                         "N" + rng.choice(LETTERS), "W" + rng.choice(LETTERS)])
+    suffix_length = 1 if len(prefix) == 2 and rng.random() < 0.2 else rng.choice([2, 3, 3])
+    return f"{prefix}{district}{''.join(rng.choices(LETTERS, k=suffix_length))}"
+
+
+def make_stations(count, seed=0):
+    # [(callsign, exchange)], unique callsigns, the first being the busiest
+    rng = random.Random(seed)
+    states = sorted(STATE_WEIGHTS)
+    state_weights = [STATE_WEIGHTS[state] for state in states]
+    counties = sorted(SC_COUNTIES)
+    provinces = sorted(CANADIAN_PROVINCES)
+
+    stations = [(call, rng.choice(counties)) for call in BONUS_STATIONS]
+    seen = set(BONUS_STATIONS)
+    while len(stations) < count:
+        location = rng.choices(list(LOCATION_WEIGHTS), LOCATION_WEIGHTS.values())[0]
+        if location == "sc":
+            call, exchange = us_call(rng, 4), rng.choice(counties)
+        elif location == "us":
+            call, exchange = us_call(rng, rng.randrange(10)), rng.choices(states, state_weights)[0]
+        elif location == "ca":
+            call = f"{rng.choice(['VE', 'VA'])}{rng.randint(1, 7)}{''.join(rng.choices(LETTERS, k=rng.choice([2, 3])))}"
+            exchange = rng.choice(provinces)
+        else:
+            call = f"{rng.choice(DX_PREFIXES)}{rng.randrange(10)}{''.join(rng.choices(LETTERS, k=rng.choice([2, 3])))}"
+            exchange = "DX"
+        if call not in seen:
+            seen.add(call)
+            stations.append((call, exchange))
+    return stations
+
+
+def make_qsos(count, seed=0, station="N4XX", exchange="RICH", stations=None):
+    # (band, freq kHz, mode, timestamp, station, rst sent, exchange sent, callsign,
+    # rst received, exchange received) in time order; stations is the pool of
+    # make_stations() worked, a fresh one sized for count by default
+    rng = random.Random(seed)
+    if stations is None:
+        stations = make_stations(max(100, min(count // 4, 200000)), seed)
+    # activity falls off roughly as 1/rank
+    activity = list(itertools.accumulate(1 / rank for rank in range(1, len(stations) + 1)))
+    bands = list(BAND_WEIGHTS)
+    band_weights = list(itertools.accumulate(BAND_WEIGHTS.values()))
+    modes = list(MODE_WEIGHTS)
+    mode_weights = list(itertools.accumulate(MODE_WEIGHTS.values()))
+
+    span = (END_TIME - START_TIME) // datetime.timedelta(minutes=1)
+    minutes = [START_TIME + datetime.timedelta(minutes=minute) for minute in range(span + 1)]
+    batch = 10000
+    for first in range(0, count, batch):
+        n = min(batch, count - first)
+        worked = rng.choices(stations, cum_weights=activity, k=n)
+        qso_bands = rng.choices(bands, cum_weights=band_weights, k=n)
+        qso_modes = rng.choices(modes, cum_weights=mode_weights, k=n)
+        for i, (call, srx), band, mode in zip(range(first, first + n), worked, qso_bands, qso_modes):
+            low, high = BAND_EDGES[band]
+            if mode == "CW":
+                freq = low + rng.randrange(min(100, high - low))
+            elif mode == "DG":
+                freq = DIGITAL_FREQUENCIES[band] + rng.randrange(3)
+            else:
+                freq = (low + high) // 2 + rng.randrange((high - low) // 2)
+            rst = 59 if mode == "PH" else 599
+            yield band, freq, mode, minutes[i * span // count], station, rst, exchange, call, rst, srx
+
+
+def write_cabrillo(f, count, seed=0, station="N4XX", exchange="RICH"):
+    f.write(f"START-OF-LOG: 3.0\nCONTEST: SC-QSO-PARTY\nCALLSIGN: {station}\nLOCATION: {exchange}\n"
+            f"CATEGORY-OPERATOR: SINGLE-OP\nCREATED-BY: benchmarks.generate\n")
+    # formatting the same minute over and over is most of the cost of big logs
+    stamps = {}
+    for _, freq, mode, timestamp, station, rst_s, stx, call, rst_r, srx in make_qsos(count, seed, station, exchange):
+        stamp = stamps.get(timestamp)
+        if stamp is None:
+            stamp = stamps[timestamp] = f"{timestamp:%Y-%m-%d %H%M}"
+        f.write(f"QSO: {freq:>5} {mode} {stamp} {station:<10} {rst_s:>3} {stx:<6} {call:<10} {rst_r:>3} {srx}\n")
+    f.write("END-OF-LOG:\n")
+
+
+def _field(name, value):
+    return f"<{name}:{len(value)}>{value}"
+
+
+def write_adif(f, count, seed=0, station="N4XX", exchange="RICH"):
+    rng = random.Random(seed)
+    f.write(f"Generated by benchmarks.generate\n{_field('adif_ver', '3.1.4')}\n{_field('programid', 'benchmarks.generate')}\n<eoh>\n")
+    stamps = {}
+    for band, freq, mode, timestamp, station, rst_s, stx, call, rst_r, srx in make_qsos(count, seed, station, exchange):
+        mode = ADIF_MODES[mode]
+        if mode == "FT8":
+            rst_s, rst_r = f"{rng.randint(-20, 5):+03d}", f"{rng.randint(-20, 5):+03d}"
+        stamp = stamps.get(timestamp)
+        if stamp is None:
+            stamp = stamps[timestamp] = (_field("qso_date", f"{timestamp:%Y%m%d}"), f"{timestamp:%H%M}")
+        f.write("".join((
+            stamp[0], _field("time_on", f"{stamp[1]}{rng.randrange(60):02d}"),
+            _field("call", call), _field("band", band), _field("freq", f"{freq / 1000:.3f}"),
+            _field("mode", mode), _field("rst_sent", str(rst_s)), _field("rst_rcvd", str(rst_r)),
+            _field("station_callsign", station), _field("contest_id", "SC-QSO-PARTY"),
+            _field("stx_string", stx), _field("srx_string", srx), "<eor>\n")))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("format", choices=["cabrillo", "adif"])
+    parser.add_argument("-n", "--count", type=int, default=1000)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", type=argparse.FileType("w"), default=sys.stdout)
+    parser.add_argument("--station", default="N4XX")
+    parser.add_argument("--exchange", default="RICH")
+    args = parser.parse_args()
+
+    write = write_cabrillo if args.format == "cabrillo" else write_adif
+    with args.output as f:
+        write(f, args.count, args.seed, args.station, args.exchange)
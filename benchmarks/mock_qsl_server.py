@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import itertools
+import zlib
+
+from aiohttp import web
+
+
+# A local stand-in for the QRZ and HamQTH XML services. Addresses are
+# derived from the callsign so runs are repeatable; calls containing a Q
+# are reported as not found.
+
+QRZ_NS = "http://xmldata.qrz.com"
+HAMQTH_NS = "https://www.hamqth.com"
+
+
+def address(callsign):
+    n = zlib.crc32(callsign.encode())
+    return {
+        "fname": "Op", "name": callsign.title(), "street": f"{n % 9000 + 100} Main St",
+        "city": ["Columbia", "Greenville", "Charleston"][n % 3], "state": ["SC", "GA", "NC"][n % 3],
+        "zip": f"{n % 90000 + 10000}", "country": "United States",
+    }
+
+
+class MockQSLServer:
+    def __init__(self, latency=0.05, session_ttl=None):
+        self.latency = latency
+        self.session_ttl = session_ttl
+        self.requests = 0
+        self.logins = 0
+        self.active = 0
+        self.peak_active = 0
+        self._sessions = {}
+        self._keys = itertools.count(1)
+        self._runner = None
+        self.port = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/qrz", self._qrz)
+        self.app.router.add_get("/hamqth", self._hamqth)
+
+    def _new_session(self):
+        key = f"{id(self):x}-{next(self._keys)}"
+        self._sessions[key] = self.session_ttl
+        self.logins += 1
+        return key
+
+    def _check_session(self, key):
+        # session_ttl counts lookups a session key is good for
+        if key not in self._sessions:
+            return False
+        if self._sessions[key] is not None:
+            if self._sessions[key] <= 0:
+                return False
+            self._sessions[key] -= 1
+        return True
+
+    async def _respond(self, body):
+        self.requests += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        return web.Response(body=body.encode(), content_type="text/xml")
+
+    async def _qrz(self, request):
+        q = request.query
+        if "username" in q:
+            session = f"<Session><Key>{self._new_session()}</Key></Session>"
+        elif not self._check_session(q.get("s")):
+            session = "<Session><Error>Session Timeout</Error></Session>"
+        elif "Q" in q["callsign"]:
+            session = f"<Session><Error>Not found: {q['callsign']}</Error></Session>"
+        else:
+            a = address(q["callsign"])
+            session = (f"<Callsign><call>{q['callsign']}</call><fname>{a['fname']}</fname><name>{a['name']}</name>"
+                       f"<addr1>{a['street']}</addr1><addr2>{a['city']}</addr2><state>{a['state']}</state>"
+                       f"<zip>{a['zip']}</zip><country>{a['country']}</country></Callsign><Session></Session>")
+        return await self._respond(f'<?xml version="1.0" ?><QRZDatabase version="1.34" xmlns="{QRZ_NS}">{session}</QRZDatabase>')
+
+    async def _hamqth(self, request):
+        q = request.query
+        if "u" in q:
+            body = f"<session><session_id>{self._new_session()}</session_id></session>"
+        elif not self._check_session(q.get("id")):
+            body = "<session><error>Session does not exist or expired</error></session>"
+        elif "Q" in q["callsign"]:
+            body = "<session><error>Callsign not found</error></session>"
+        else:
+            a = address(q["callsign"])
+            body = (f"<search><callsign>{q['callsign']}</callsign><adr_name>{a['fname']} {a['name']}</adr_name>"
+                    f"<adr_street1>{a['street']}</adr_street1><adr_city>{a['city']}</adr_city>"
+                    f"<adr_zip>{a['zip']}</adr_zip><adr_country>{a['country']}</adr_country>"
+                    f"<us_state>{a['state']}</us_state></search>")
+        return await self._respond(f'<?xml version="1.0"?><HamQTH version="2.8" xmlns="{HAMQTH_NS}">{body}</HamQTH>')
+
+    def url(self, service):
+        return f"http://127.0.0.1:{self.port}/{service.lower()}?"
+
+    async def start(self, port=0):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+async def serve(port, latency):
+    server = MockQSLServer(latency)
+    await server.start(port)
+    print(f"QRZ:    {server.url('QRZ')}")
+    print(f"HamQTH: {server.url('HamQTH')}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.latency))
@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import make_stations, write_adif, write_cabrillo
+
+# End-to-end benchmarks of the command line tools on generated logs. Every
+# run is a fresh interpreter running the tool with --timings-json, so the
+# numbers include startup the way a user sees it; peak memory is the
+# maximum resident set size of that process. Generated logs are kept in
+# the data directory, so repeated runs use the very same input, and the
+# best of the repeated runs is reported. Results can be stored as a
+# baseline that later runs are compared against.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# ru_maxrss is in kilobytes, except on macOS
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+# higher is better for these metrics, lower for the others
+HIGHER_IS_BETTER = {"records_per_second"}
+
+
+def data_file(data_dir, kind, count, seed):
+    write, suffix = {"cabrillo": (write_cabrillo, ".log"), "adif": (write_adif, ".adi")}[kind]
+    path = os.path.join(data_dir, f"{kind}-{count}-{seed}{suffix}")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            write(f, count, seed)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def run(command, stdin=None):
+    # (wall seconds, peak RSS in bytes, timings summary) of one run
+    with tempfile.TemporaryDirectory() as tmp:
+        summary_path = os.path.join(tmp, "timings.json")
+        start = time.perf_counter()
+        process = subprocess.Popen(command + ["--timings-json", summary_path], cwd=ROOT, stdin=stdin or subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # wait4() rather than wait() for the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}")
+        with open(summary_path) as f:
+            summary = json.load(f)
+    return elapsed, usage.ru_maxrss * MAXRSS_UNIT, summary
+
+
+class Case:
+    # One tool on one kind of input. command() gives the command line for
+    # a generated log, records names the counter of processed records, and
+    # latency the stage whose time per record is reported as latency.
+    kind = None
+    records = None
+    latency = None
+
+    def __init__(self, args):
+        self.args = args
+
+    def setup(self, path):
+        pass
+
+    def command(self, path):
+        raise NotImplementedError
+
+    def stdin(self, path):
+        return None
+
+    def stage_seconds(self, runs, stage):
+        return min(summary["stages"][stage]["seconds"] for _, _, summary in runs)
+
+    def metrics(self, runs, count):
+        seconds = min(elapsed for elapsed, _, _ in runs)
+        summary = runs[0][2]
+        metrics = {"seconds": seconds, "peak_rss_mb": max(rss for _, rss, _ in runs) / (1 << 20)}
+        records = summary["counts"].get(self.records)
+        if records:
+            metrics["records_per_second"] = records / seconds
+            if self.latency in summary["stages"]:
+                metrics["latency_ms"] = 1000 * self.stage_seconds(runs, self.latency) / records
+        return metrics
+
+
+class ScqpscoreCase(Case):
+    kind = "cabrillo"
+    records = "qsos"
+    latency = "score"
+
+    def command(self, path):
+        return [sys.executable, "scqpscore.py", "-f", path, "--report", "plain"]
+
+
+class ScqpscoreCacheCase(ScqpscoreCase):
+    # scoring from a warm sidecar cache
+    latency = "parse"
+
+    def setup(self, path):
+        run(self.command(path))
+
+    def command(self, path):
+        return super().command(path) + ["--cache"]
+
+
+class ADIFBatchEditCase(Case):
+    kind = "adif"
+    records = "records"
+    latency = "edit"
+
+    def command(self, path):
+        return [sys.executable, "adif_batch_edit.py", "-f", path, "-o", os.devnull, "-j", str(self.args.jobs),
+                "where|band=20m|mode=CW", "update|comment:=upper(call)", "end", "add|my_state=SC", "delete|contest_id"]
+
+
+class SimpleLoggerCase(Case):
+    # logging a few QSOs on top of the generated log, which is indexed first
+    kind = "adif"
+    records = "qsos"
+    latency = "write"
+
+    def setup(self, path):
+        self._log = os.path.join(self.args.data_dir, "simplelogger.adi")
+        self._entries = os.path.join(self.args.data_dir, "simplelogger-entries.txt")
+        # band, mode, call, date/time, rst, exchange, confirm
+        with open(self._entries, "w") as f:
+            for call, exchange in make_stations(self.args.entries, seed=1):
+                f.write(f"20m\nCW\n{call}\n\n\n{exchange}\ny\n")
+
+    def command(self, path):
+        shutil.copyfile(path, self._log)
+        return [sys.executable, "simplelogger.py", "--station-callsign", "N4XX", "-o", self._log]
+
+    def stdin(self, path):
+        return open(self._entries)
+
+    def metrics(self, runs, count):
+        # throughput is how fast the existing log is indexed at startup
+        metrics = super().metrics(runs, count)
+        metrics["records_per_second"] = count / self.stage_seconds(runs, "index")
+        return metrics
+
+
+class HamqsladdrCase(Case):
+    # lookups against the local mock QRZ server rather than a log
+    records = "lookups"
+    latency = "network"
+
+    def command(self, path):
+        return [sys.executable, "-m", "benchmarks.bench_hamqsladdr", "-n", str(self.args.lookups), "-c",
+                str(self.args.concurrency), "--latency", str(self.args.latency), "-s", "QRZ"]
+
+    def metrics(self, runs, count):
+        metrics = super().metrics(runs, count)
+        # network time is summed over concurrent requests, one per lookup and login
+        metrics["latency_ms"] = 1000 * self.stage_seconds(runs, "network") / runs[0][2]["counts"]["requests"]
+        return metrics
+
+
+CASES = {
+    "scqpscore": ScqpscoreCase,
+    "scqpscore-cache": ScqpscoreCacheCase,
+    "adif_batch_edit": ADIFBatchEditCase,
+    "simplelogger": SimpleLoggerCase,
+    "hamqsladdr": HamqsladdrCase,
+}
+
+
+def run_case(case, path, count, repeat):
+    case.setup(path)
+    runs = []
+    for _ in range(repeat):
+        command = case.command(path)
+        stdin = case.stdin(path)
+        try:
+            runs.append(run(command, stdin))
+        finally:
+            if stdin is not None:
+                stdin.close()
+    return case.metrics(runs, count)
+
+
+def compare(results, baseline, tolerance):
+    # {(key, metric): (baseline, result, relative change)} of the metrics
+    # that got worse by more than tolerance
+    regressions = {}
+    for key, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(key, {}).get(metric)
+            if not base:
+                continue
+            change = (value - base) / base
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions[key, metric] = (base, value, change)
+    return regressions
+
+
+def format_row(key, metrics, baseline):
+    base = baseline.get(key, {}).get("seconds")
+    change = f"{100 * (metrics['seconds'] - base) / base:>+7.1f}%" if base else f"{'-':>8}"
+    return (f"{key:<26} {metrics['seconds']:>9.3f} {metrics.get('records_per_second', 0):>12.0f} "
+            f"{metrics.get('latency_ms', 0):>11.4f} {metrics['peak_rss_mb']:>9.1f} {change}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--case", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("-n", "--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument("--entries", type=int, default=50)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "qso-benchmarks"))
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    print(f"{'case':<26} {'seconds':>9} {'records/s':>12} {'latency ms':>11} {'peak MB':>9} {'vs base':>8}")
+    for name in args.case:
+        case = CASES[name](args)
+        # the mock server lookups don't depend on a log size
+        for count in [args.lookups] if case.kind is None else args.sizes:
+            path = None if case.kind is None else data_file(args.data_dir, case.kind, count, args.seed)
+            key = f"{name}/{count}"
+            results[key] = run_case(case, path, count, args.repeat)
+            print(format_row(key, results[key], baseline), flush=True)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for (key, metric), (base, value, change) in regressions.items():
+        print(f"REGRESSION {key} {metric}: {base:.4g} -> {value:.4g} ({100 * change:+.1f}%)")
+    sys.exit(1 if regressions else 0)
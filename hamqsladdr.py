@@ -1,120 +1,378 @@
 import asyncio
 import argparse
+import collections
+import contextlib
+import json
+import os
+import sqlite3
 import sys
+import time
 import xml.etree.ElementTree as ET
 
 from urllib.parse import urlencode
 
 import aiohttp
 
+from adifstream import ADIStreamReader
+from timings import NO_TIMINGS, add_timing_arguments, instrument
 
-class HamQTH:
-    xmlurl = 'https://www.hamqth.com/xml.php?'
-    xmlns = {'ns': 'https://www.hamqth.com'}
-    
-    def __init__(self, user, passwd):
+
+class SessionExpired(RuntimeError):
+    pass
+
+
+class Service:
+    # Base class for the lookup services. Subclasses declare the XML
+    # namespace, which session elements hold the key and errors, and which
+    # record elements map to address fields; the element names are compiled
+    # once into a {ns}tag lookup. Responses are fed to the parser as they
+    # stream in and the finished tree is walked once against that lookup.
+    #
+    # A session key can be handed in from an earlier run; requests made with
+    # an expired key log in again once and are retried, and concurrent
+    # lookups that hit the same expired key share a single re-login.
+    #
+    # Request time is split into "network" (summed over concurrent
+    # requests) and "parse" in the timings.
+    xmlurl = None
+    namespace = None
+    session_param = None
+    session_errors = ()
+    session_fields = {}
+    fields = {}
+    unsupported = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ns = '{%s}' % cls.namespace
+        cls._tags = {}
+        for slot, mapping in (('session', cls.session_fields), ('fields', cls.fields), ('unsupported', cls.unsupported)):
+            for tag, key in mapping.items():
+                cls._tags[ns + tag] = (slot, key)
+
+    def __init__(self, user, passwd, sessionid=None):
         self._user = user
         self._passwd = passwd
-        self._sessionid = None
+        self._sessionid = sessionid
+        self._login_lock = asyncio.Lock()
+        self.timings = NO_TIMINGS
+
+    @property
+    def user(self):
+        return self._user
+
+    @property
+    def sessionid(self):
+        return self._sessionid
+
+    @sessionid.setter
+    def sessionid(self, sessionid):
+        self._sessionid = sessionid
+
+    def _error(self, text):
+        if any(error in (text or '').lower() for error in self.session_errors):
+            return SessionExpired(text)
+        return RuntimeError(text)
+
+    def _extract(self, root):
+        tags = self._tags
+        parsed = {'session': {}, 'fields': {}, 'unsupported': {}}
+        for elmt in root.iter():
+            target = tags.get(elmt.tag)
+            if target is not None:
+                parsed[target[0]][target[1]] = elmt.text
+
+        session = parsed['session']
+        if 'message' in session:
+            raise RuntimeError(session['message'])
+        if 'error' in session:
+            raise self._error(session['error'])
+        if parsed['unsupported']:
+            raise RuntimeError(next(iter(parsed['unsupported'])))
+        return session, parsed['fields']
+
+    def parse(self, chunks):
+        # (session, fields) from a response given as an iterable of bytes
+        parser = ET.XMLParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+        return self._extract(parser.close())
 
     async def _make_request(self, client_session, **kwargs):
-        params = urlencode(kwargs)
-        async with client_session.get(self.xmlurl + params) as resp:
-            resp.raise_for_status()
-            root = ET.fromstring(await resp.read())
-            err = root.find('ns:session/ns:error', self.xmlns)
-            if err is not None:
-                raise RuntimeError(err.text)
-            return root
+        clock = time.perf_counter
+        start = clock()
+        parse_time = 0.0
+        parser = ET.XMLParser()
+        try:
+            async with client_session.get(self.xmlurl + urlencode(kwargs)) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.content.iter_any():
+                    fed = clock()
+                    parser.feed(chunk)
+                    parse_time += clock() - fed
+            fed = clock()
+            try:
+                return self._extract(parser.close())
+            finally:
+                parse_time += clock() - fed
+        finally:
+            self.timings.add('network', clock() - start - parse_time)
+            self.timings.add('parse', parse_time)
+            self.timings.count('requests')
 
     async def login(self, client_session):
-        result = await self._make_request(client_session, u=self._user, p=self._passwd)
-        sessidelmt = result.find('ns:session/ns:session_id', self.xmlns)
-        if sessidelmt is not None:
-            self._sessionid = sessidelmt.text.strip()
-        else:
+        self.timings.count('logins')
+        session, _ = await self._make_request(client_session, **self.login_params())
+        if session.get('key') is None:
             raise RuntimeError('No session id but no error specified!')
+        self._sessionid = session['key'].strip()
 
-    async def lookup(self, client_session, callsign):
-        result = await self._make_request(client_session, id=self._sessionid, callsign=callsign, prg='python')
-        search = result.find('ns:search', self.xmlns)
-        addr = {}
-        for elmt in list(search):
-            if elmt.tag == '{https://www.hamqth.com}adr_name':
-                addr['name'] = elmt.text
-            elif elmt.tag == '{https://www.hamqth.com}adr_street1':
-                addr['street'] = elmt.text
-            elif elmt.tag.startswith('{https://www.hamqth.com}adr_street'):
-                raise RuntimeError('Cannot deal with multiple street addresses')
-            elif elmt.tag == '{https://www.hamqth.com}adr_city':
-                addr['city'] = elmt.text
-            elif elmt.tag == '{https://www.hamqth.com}adr_zip':
-                addr['zip'] = elmt.text
-            elif elmt.tag == '{https://www.hamqth.com}adr_country':
-                addr['country'] = elmt.text
-            elif elmt.tag == '{https://www.hamqth.com}us_state':
-                addr['state'] = elmt.text
+    async def _relogin(self, client_session, expired):
+        async with self._login_lock:
+            if self._sessionid == expired:
+                await self.login(client_session)
+
+    async def _session_request(self, client_session, **kwargs):
+        for retry in (False, True):
+            sessionid = self._sessionid
+            if sessionid is None:
+                await self._relogin(client_session, None)
+                sessionid = self._sessionid
+            try:
+                return await self._make_request(client_session, **{self.session_param: sessionid}, **kwargs)
+            except SessionExpired:
+                if retry:
+                    raise
+                await self._relogin(client_session, sessionid)
+
+    def login_params(self):
+        raise NotImplementedError
+
+    def lookup_params(self, callsign):
+        raise NotImplementedError
+
+    def address(self, fields):
+        # every address field, None where the record has none
+        addr = dict.fromkeys(self.fields.values())
+        addr.update(fields)
         return addr
 
+    async def lookup(self, client_session, callsign):
+        _, fields = await self._session_request(client_session, **self.lookup_params(callsign))
+        return self.address(fields)
+
+
+class HamQTH(Service):
+    xmlurl = 'https://www.hamqth.com/xml.php?'
+    namespace = 'https://www.hamqth.com'
+    session_param = 'id'
+    session_errors = ('session does not exist or expired',)
+    session_fields = {'session_id': 'key', 'error': 'error'}
+    fields = {'adr_name': 'name', 'adr_street1': 'street', 'adr_city': 'city', 'adr_zip': 'zip',
+              'adr_country': 'country', 'us_state': 'state'}
+    unsupported = {'adr_street2': 'Cannot deal with multiple street addresses',
+                   'adr_street3': 'Cannot deal with multiple street addresses'}
+
+    def login_params(self):
+        return {'u': self._user, 'p': self._passwd}
 
-class QRZ:
+    def lookup_params(self, callsign):
+        return {'callsign': callsign, 'prg': 'python'}
+
+
+class QRZ(Service):
     xmlurl = 'https://xmldata.qrz.com/xml/1.25/?'
-    xmlns = {'ns': 'http://xmldata.qrz.com'}
-    
-    def __init__(self, user, passwd):
-        self._user = user
-        self._passwd = passwd
-        self._sessionid = None
+    namespace = 'http://xmldata.qrz.com'
+    session_param = 's'
+    session_errors = ('session timeout', 'invalid session key')
+    session_fields = {'Key': 'key', 'Error': 'error', 'Message': 'message'}
+    fields = {'fname': 'fname', 'name': 'name', 'addr1': 'street', 'addr2': 'city', 'zip': 'zip',
+              'country': 'country', 'state': 'state'}
 
-    async def _make_request(self, client_session, **kwargs):
-        params = urlencode(kwargs)
-        async with client_session.get(self.xmlurl + params) as resp:
-            resp.raise_for_status()
-            root = ET.fromstring(await resp.read())
-            msg = root.find('ns:Session/ns:Message', self.xmlns)
-            error = root.find('ns:Session/ns:Error', self.xmlns)
-            if msg is not None:
-                raise RuntimeError(msg.text)
-            if error is not None:
-                raise RuntimeError(error.text)
-            return root
+    def login_params(self):
+        return {'username': self._user, 'password': self._passwd}
 
-    async def login(self, client_session):
-        result = await self._make_request(client_session, username=self._user, password=self._passwd)
-        sessidelmt = result.find('ns:Session/ns:Key', self.xmlns)
-        if sessidelmt is not None:
-            self._sessionid = sessidelmt.text.strip()
-        else:
-            raise RuntimeError('No session id!')
+    def lookup_params(self, callsign):
+        return {'callsign': callsign, 'prg': 'tuxsoft'}
 
-    async def lookup(self, client_session, callsign):
-        result = await self._make_request(client_session, s=self._sessionid, callsign=callsign, prg='tuxsoft')
-        addr = {}
-        fname = result.find('ns:Callsign/ns:fname', self.xmlns).text
-        lname = result.find('ns:Callsign/ns:name', self.xmlns).text
-        addr['name'] = f'{fname} {lname}'
-        addr['street'] = result.find('ns:Callsign/ns:addr1', self.xmlns).text
-        addr['city'] = result.find('ns:Callsign/ns:addr2', self.xmlns).text
-        addr['zip'] = result.find('ns:Callsign/ns:zip', self.xmlns).text
-        addr['country'] = result.find('ns:Callsign/ns:country', self.xmlns).text
-        addr['state'] = result.find('ns:Callsign/ns:state', self.xmlns).text
+    def address(self, fields):
+        addr = super().address(fields)
+        addr['name'] = ' '.join(filter(None, (addr.pop('fname'), addr['name'])))
         return addr
 
 
-async def amain(svc, output_file_name, callsigns):
-    async with aiohttp.ClientSession() as client_session:
-        await svc.login(client_session)
+class LookupCache:
+    # Addresses keyed by (service, callsign) in a SQLite file. Entries older
+    # than ttl seconds are stale and looked up again; past max_entries the
+    # least recently used entries are dropped.
+
+    def __init__(self, path, ttl=30 * 86400, max_entries=10000):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self.stats = collections.Counter()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS lookups (service TEXT, callsign TEXT, address TEXT, '
+                           'fetched REAL, used REAL, PRIMARY KEY (service, callsign))')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS sessions (service TEXT, user TEXT, sessionid TEXT, '
+                           'PRIMARY KEY (service, user))')
+
+    def get(self, service, callsign):
+        row = self._conn.execute('SELECT address, fetched FROM lookups WHERE service = ? AND callsign = ?',
+                                 (service, callsign)).fetchone()
+        if row is None:
+            self.stats['miss'] += 1
+            return None
+        if row[1] + self._ttl < time.time():
+            self.stats['stale'] += 1
+            return None
+        self.stats['hit'] += 1
+        self._conn.execute('UPDATE lookups SET used = ? WHERE service = ? AND callsign = ?', (time.time(), service, callsign))
+        return json.loads(row[0])
+
+    def put(self, service, callsign, address):
+        now = time.time()
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?)',
+                               (service, callsign, json.dumps(address), now, now))
+
+    def get_session(self, service, user):
+        row = self._conn.execute('SELECT sessionid FROM sessions WHERE service = ? AND user = ?', (service, user)).fetchone()
+        return None if row is None else row[0]
+
+    def put_session(self, service, user, sessionid):
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)', (service, user, sessionid))
+
+    def evict(self):
+        with self._conn:
+            self._conn.execute('DELETE FROM lookups WHERE rowid IN (SELECT rowid FROM lookups ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                               (self._max_entries,))
+
+    def close(self):
+        self.evict()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RateLimiter:
+    # spaces request starts at least 1/rate seconds apart; None means no limit
+    def __init__(self, rate=None):
+        self._interval = 1 / rate if rate else 0
+        self._next = 0
+
+    async def wait(self):
+        if not self._interval:
+            return
+        now = asyncio.get_running_loop().time()
+        delay = self._next - now
+        self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
 
-        if output_file_name:
-            output_file = open(args.output_file, 'w')
+async def lookup_all(svc, client_session, callsigns, concurrency=8, rate=None, cache=None):
+    # Looks up to `concurrency` callsigns at once and yields
+    # (callsign, address or RuntimeError) in input order, as soon as each
+    # result and all the ones before it are in. Successful lookups are
+    # stored in the cache, if given.
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    service = type(svc).__name__
+
+    async def lookup(callsign):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                result = await svc.lookup(client_session, callsign)
+            except RuntimeError as e:
+                return e
+        if cache is not None:
+            cache.put(service, callsign, result)
+        return result
+
+    tasks = [asyncio.ensure_future(lookup(callsign)) for callsign in callsigns]
+    try:
+        for callsign, task in zip(callsigns, tasks):
+            yield callsign, await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def lookup_cached(svc, client_session, callsigns, concurrency=8, rate=None, cache=None, refresh=False):
+    # Like lookup_all, but answers from the cache where it can and only
+    # logs in if something is left to look up and there is no session key
+    # yet. refresh skips cache reads.
+    cached = {}
+    if cache is not None and not refresh:
+        service = type(svc).__name__
+        for callsign in callsigns:
+            if callsign not in cached:
+                cached[callsign] = cache.get(service, callsign)
+    pending = [callsign for callsign in callsigns if cached.get(callsign) is None]
+
+    if pending and svc.sessionid is None:
+        await svc.login(client_session)
+    results = aiter(lookup_all(svc, client_session, pending, concurrency, rate, cache))
+    for callsign in callsigns:
+        if cached.get(callsign) is not None:
+            yield callsign, dict(cached[callsign])
         else:
-            output_file = sys.stdout
+            yield await anext(results)
+
+
+def adif_callsigns(adif_files, skip_sent=False):
+    # unique callsigns from ADIF logs in first-seen order, optionally
+    # leaving out QSOs whose QSL has already been sent
+    callsigns = {}
+    for adif_file in adif_files:
+        for record in ADIStreamReader(adif_file):
+            if skip_sent and (record.get('qsl_sent') or '').upper() == 'Y':
+                continue
+            if record.get('call'):
+                callsigns.setdefault(record['call'].upper(), None)
+    return list(callsigns)
 
-        with output_file:
-            for callsign in callsigns:
-                callsign = callsign.upper()
-                try:
-                    result = await svc.lookup(client_session, callsign)
+
+def format_label(callsign, result):
+    lines = [callsign, result['name'], result['street'], ' '.join(filter(None, (result['city'], result['state'], result['zip'])))]
+    if result['country'] != 'United States':
+        lines.append(result['country'])
+    return '\n'.join(line or '' for line in lines) + '\n'
+
+
+async def amain(svc, output_file_name, callsigns, concurrency=8, rate=None, cache=None, refresh=False,
+                pool_size=None, keepalive=30.0, output_format='csv'):
+    if cache is not None and svc.sessionid is None:
+        svc.sessionid = cache.get_session(type(svc).__name__, svc.user)
+    # keep enough connections alive for every concurrent lookup so long
+    # batches reuse them instead of paying for new TLS handshakes
+    connector = aiohttp.TCPConnector(limit=pool_size or concurrency, keepalive_timeout=keepalive)
+    async with aiohttp.ClientSession(connector=connector) as client_session:
+        try:
+            if output_file_name:
+                output_file = open(output_file_name, 'w')
+            else:
+                # stdout stays open for the cache stats printed afterwards
+                output_file = contextlib.nullcontext(sys.stdout)
+
+            with output_file:
+                callsigns = [callsign.upper() for callsign in callsigns]
+                async for callsign, result in lookup_cached(svc, client_session, callsigns, concurrency, rate, cache, refresh):
+                    svc.timings.count('lookups')
+                    if isinstance(result, RuntimeError):
+                        svc.timings.count('failed')
+                        print('Failed to lookup callsign: {} - {}'.format(callsign, str(result)))
+                        continue
+                    # fields the record didn't have print and export as empty
+                    result = {key: value or '' for key, value in result.items()}
 
                     print('{}:\n'
                           '\t{name}\n'
@@ -122,13 +380,15 @@ async def amain(svc, output_file_name, callsigns):
                           '\t{city} {state} {zip}\n'
                           '\t{country}\n'.format(callsign, **result))
 
-                    if args.output_file:
+                    if output_file_name and output_format == 'labels':
+                        print(format_label(callsign, result), file=output_file)
+                    elif output_file_name:
                         if result['country'] == 'United States':
                             result['country'] = ''
-                            print(','.join((callsign, result['name'], result['street'], result['city'], result['state'], result['zip'], result['country'])), file=output_file)
-
-                except RuntimeError as e:
-                    print('Failed to lookup callsign: {} - {}'.format(callsign, str(e)))
+                        print(','.join((callsign, result['name'], result['street'], result['city'], result['state'], result['zip'], result['country'])), file=output_file)
+        finally:
+            if cache is not None and svc.sessionid is not None:
+                cache.put_session(type(svc).__name__, svc.user, svc.sessionid)
 
 
 if __name__ == '__main__':
@@ -137,8 +397,44 @@ if __name__ == '__main__':
     parser.add_argument('-u', '--user', required=True)
     parser.add_argument('-p', '--passwd', required=True)
     parser.add_argument('-o', '--output-file')
-    parser.add_argument('callsigns', nargs='+')
+    parser.add_argument('--format', default='csv', choices=['csv', 'labels'])
+    parser.add_argument('-a', '--adif', type=argparse.FileType('r'), action='append', default=[])
+    parser.add_argument('--skip-sent', action='store_true')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-r', '--rate', type=float)
+    parser.add_argument('--cache', default=os.path.expanduser('~/.cache/hamqsladdr.sqlite'))
+    parser.add_argument('--cache-ttl', type=float, default=30)
+    parser.add_argument('--cache-size', type=int, default=10000)
+    parser.add_argument('--refresh', action='store_true')
+    parser.add_argument('--pool-size', type=int)
+    parser.add_argument('--keepalive', type=float, default=30.0)
+    add_timing_arguments(parser)
+    parser.add_argument('callsigns', nargs='*')
     args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if args.rate is not None and args.rate <= 0:
+        parser.error('--rate must be positive')
+
+    with instrument(args) as timings:
+        callsigns = list(dict.fromkeys(callsign.upper() for callsign in args.callsigns))
+        if args.adif:
+            with timings.stage('adif'):
+                callsigns = list(dict.fromkeys(callsigns + adif_callsigns(args.adif, args.skip_sent)))
+        if not callsigns:
+            parser.error('no callsigns given')
 
-    svc = globals()[args.plugin](args.user, args.passwd)
-    asyncio.run(amain(svc, args.output_file, args.callsigns))
+        svc = globals()[args.plugin](args.user, args.passwd)
+        svc.timings = timings
+        options = dict(concurrency=args.concurrency, rate=args.rate, pool_size=args.pool_size, keepalive=args.keepalive,
+                       output_format=args.format)
+        if args.cache:
+            with LookupCache(args.cache, args.cache_ttl * 86400, args.cache_size) as cache:
+                with timings.stage('lookup'):
+                    asyncio.run(amain(svc, args.output_file, callsigns, cache=cache, refresh=args.refresh, **options))
+                print('Cache: {hit} hits, {miss} misses, {stale} stale'.format_map(cache.stats))
+                for name, n in cache.stats.items():
+                    timings.count('cache_' + name, n)
+        else:
+            with timings.stage('lookup'):
+                asyncio.run(amain(svc, args.output_file, callsigns, **options))
@@ -0,0 +1,176 @@
+import argparse
+import bisect
+import collections
+import datetime
+import enum
+import typing
+
+from qsorecord import QSOLog
+from scqpscore import SCQP_2023, ContestRules, load_qsos
+from timings import add_timing_arguments, instrument
+
+
+Status = enum.Enum("Status", "OK NOT_IN_LOG BUSTED_CALL BUSTED_EXCHANGE UNVERIFIED".split())
+
+ONE_MINUTE = datetime.timedelta(minutes=1)
+
+
+class CheckResult(typing.NamedTuple):
+    qso: typing.Any
+    status: Status
+    detail: typing.Optional[str] = None
+
+
+def edit_distance(a, b):
+    # optimal string alignment distance (Levenshtein plus adjacent transpositions)
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _deletes(call, depth):
+    variants = {call}
+    for _ in range(depth):
+        variants |= {v[:i] + v[i + 1:] for v in variants for i in range(len(v))}
+    return variants
+
+
+class LogChecker:
+    # Matches every QSO against the other station's log.
+    #
+    # QSOs are indexed by (station, callsign, band, mode) with time-sorted
+    # minute arrays, so each match is a dict lookup plus a bisect over the
+    # handful of QSOs two stations made on one band/mode. Near-miss calls
+    # are found through a deletion index of the submitted station calls
+    # instead of comparing against every station. The QSOs themselves are
+    # held column-wise in a QSOLog.
+    #
+    # Matching is one-to-one: a QSO confirmed by a QSO in the other log is
+    # paired with it, and that QSO can't confirm any other one. A QSO that
+    # was already paired from the other side reuses its partner.
+
+    def __init__(self, window=datetime.timedelta(minutes=10), max_distance=1):
+        self._window = window // ONE_MINUTE
+        self._max_distance = max_distance
+        self._qsos = QSOLog()
+        self._index = None
+        self._partner = {}
+
+    def add_qsos(self, qsos):
+        self._qsos.extend(qsos)
+        self._index = None
+
+    def build(self):
+        # index the QSOs added so far; checking does this itself when needed
+        groups = collections.defaultdict(list)
+        qsos = self._qsos
+        keys = zip(qsos.column("station"), qsos.column("callsign"), qsos.column("band"), qsos.column("mode"))
+        for i, (key, timestamp) in enumerate(zip(keys, qsos.column("timestamp"))):
+            groups[key].append((timestamp // 60, i))
+
+        self._index = {}
+        self._partner = {}
+        for key, entries in groups.items():
+            entries.sort()
+            self._index[key] = ([minute for minute, _ in entries], [i for _, i in entries])
+
+        self._stations = set(qsos.values("station"))
+        self._near_calls = collections.defaultdict(set)
+        for station in self._stations:
+            for variant in _deletes(station, self._max_distance):
+                self._near_calls[variant].add(station)
+
+    def _find(self, station, callsign, band, mode, minute):
+        entry = self._index.get((station, callsign, band, mode))
+        if entry is None:
+            return None
+        minutes, indexes = entry
+        i = bisect.bisect_left(minutes, minute - self._window)
+        best = None
+        while i < len(minutes) and minutes[i] <= minute + self._window:
+            if indexes[i] not in self._partner and (best is None or abs(minutes[i] - minute) < abs(minutes[best] - minute)):
+                best = i
+            i += 1
+        return None if best is None else indexes[best]
+
+    def near_calls(self, callsign):
+        candidates = set()
+        for variant in _deletes(callsign, self._max_distance):
+            candidates |= self._near_calls.get(variant, set())
+        candidates.discard(callsign)
+        return sorted(c for c in candidates if edit_distance(callsign, c) <= self._max_distance)
+
+    def check_qso(self, qso, i=None):
+        # i is the position of qso in the checked logs, if it is one of them
+        if self._index is None:
+            self.build()
+
+        minute = qso.timestamp // 60
+        if qso.callsign in self._stations:
+            other = self._partner.get(i) if i is not None else None
+            if other is None:
+                other = self._find(qso.callsign, qso.station, qso.band, qso.mode, minute)
+                if other is not None:
+                    self._partner[other] = i
+                    if i is not None:
+                        self._partner[i] = other
+            if other is not None:
+                stx = self._qsos.get(other, "stx")
+                if stx != qso.srx:
+                    return CheckResult(qso, Status.BUSTED_EXCHANGE, f"logged {qso.srx}, sent {stx}")
+                return CheckResult(qso, Status.OK)
+            # a station that sent a log and doesn't have the QSO
+            return CheckResult(qso, Status.NOT_IN_LOG)
+
+        for callsign in self.near_calls(qso.callsign):
+            if self._find(callsign, qso.station, qso.band, qso.mode, minute) is not None:
+                return CheckResult(qso, Status.BUSTED_CALL, f"logged {qso.callsign}, worked {callsign}")
+        return CheckResult(qso, Status.UNVERIFIED)
+
+    def check(self):
+        if self._index is None:
+            self.build()
+        for i, qso in enumerate(self._qsos):
+            yield self.check_qso(qso, i)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", nargs="+", required=True)
+    parser.add_argument("-w", "--window", type=int, default=10)
+    parser.add_argument("-d", "--max-distance", type=int, default=1)
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--rules")
+    add_timing_arguments(parser)
+    args = parser.parse_args()
+
+    rules = ContestRules.load(args.rules) if args.rules else SCQP_2023
+
+    with instrument(args) as timings:
+        checker = LogChecker(datetime.timedelta(minutes=args.window), args.max_distance)
+        for f in args.file:
+            checker.add_qsos(timings.iterate("parse", load_qsos(f, rules, args.cache, timings), "qsos"))
+        with timings.stage("index"):
+            checker.build()
+
+        totals = collections.defaultdict(collections.Counter)
+        for result in timings.iterate("check", checker.check()):
+            qso = result.qso
+            totals[qso.station][result.status] += 1
+            if result.status not in (Status.OK, Status.UNVERIFIED):
+                print(f"{qso.station} {qso.datetime.strftime('%Y-%m-%d %H%M')} {qso.band} {qso.mode.name} "
+                      f"{qso.callsign}: {result.status.name}{' - ' + result.detail if result.detail else ''}")
+
+        with timings.stage("render"):
+            print()
+            print(f"{'STATION':<10} " + " ".join(f"{status.name:>15}" for status in Status))
+            for station in sorted(totals):
+                print(f"{station:<10} " + " ".join(f"{totals[station][status]:>15}" for status in Status))
@@ -0,0 +1,261 @@
+import array
+import collections
+import datetime
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+CACHE_SUFFIX = ".qsocache"
+CACHE_VERSION = 1
+_CACHE_MAGIC = b"QSOLOG\x00\n"
+
+# hits and misses of load_cached() in this process
+cache_stats = collections.Counter()
+
+
+def to_epoch(dt):
+    return (dt - EPOCH) // datetime.timedelta(seconds=1)
+
+
+def from_epoch(timestamp):
+    return EPOCH + datetime.timedelta(seconds=timestamp)
+
+
+class QSO:
+    # One contact. Timestamps are integer seconds since 1970 (UTC, like the
+    # logs), strings are interned and rst values are ints, or None if the
+    # log didn't have one. mode is whatever the tool uses to name modes;
+    # scqpscore keeps its Mode enum there.
+    __slots__ = ("band", "mode", "timestamp", "station", "rst_s", "stx", "callsign", "rst_r", "srx", "freq")
+
+    def __init__(self, band, mode, timestamp, station, rst_s, stx, callsign, rst_r, srx, freq=None):
+        self.band = band
+        self.mode = mode
+        self.timestamp = timestamp
+        self.station = station
+        self.rst_s = rst_s
+        self.stx = stx
+        self.callsign = callsign
+        self.rst_r = rst_r
+        self.srx = srx
+        self.freq = freq
+
+    @property
+    def datetime(self):
+        return from_epoch(self.timestamp)
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return QSO(**values)
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, QSO):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return "QSO(" + ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__) + ")"
+
+
+class QSOLog:
+    # QSOs stored column by column in arrays: strings (and modes) as codes
+    # into per-column tables, timestamps and numbers as machine integers.
+    # A QSO costs about 40 bytes instead of a few hundred as an object;
+    # indexing and iteration hand out QSO objects built on the fly.
+    STRING_COLUMNS = ("band", "mode", "station", "stx", "callsign", "srx")
+
+    NUMBER_COLUMNS = (("timestamp", "q"), ("rst_s", "H"), ("rst_r", "H"), ("freq", "I"))
+
+    def __init__(self, qsos=()):
+        # name -> (value -> code, code -> value, codes)
+        self._strings = {name: ({}, [], array.array("I")) for name in self.STRING_COLUMNS}
+        self._timestamp = array.array("q")
+        # 0 stands for a missing rst or frequency
+        self._rst_s = array.array("H")
+        self._rst_r = array.array("H")
+        self._freq = array.array("I")
+        self._readonly = False
+        self.extend(qsos)
+
+    def _columns(self):
+        for name in self.STRING_COLUMNS:
+            yield name, self._strings[name][2]
+        for name, _ in self.NUMBER_COLUMNS:
+            yield name, getattr(self, "_" + name)
+
+    def _make_writable(self):
+        # a loaded log's columns are read-only views of the cache file
+        for name, (codes, values, column) in self._strings.items():
+            self._strings[name] = (codes, values, array.array("I", column))
+        for name, typecode in self.NUMBER_COLUMNS:
+            setattr(self, "_" + name, array.array(typecode, getattr(self, "_" + name)))
+        self._readonly = False
+
+    def append(self, qso):
+        if self._readonly:
+            self._make_writable()
+        for name, (codes, values, column) in self._strings.items():
+            value = getattr(qso, name)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(values)
+                values.append(value)
+            column.append(code)
+        self._timestamp.append(qso.timestamp)
+        self._rst_s.append(qso.rst_s or 0)
+        self._rst_r.append(qso.rst_r or 0)
+        self._freq.append(qso.freq or 0)
+
+    def extend(self, qsos):
+        for qso in qsos:
+            self.append(qso)
+
+    def __len__(self):
+        return len(self._timestamp)
+
+    def values(self, name):
+        # the distinct values of a string column
+        return list(self._strings[name][1])
+
+    def column(self, name):
+        if name in self._strings:
+            _, values, column = self._strings[name]
+            return map(values.__getitem__, column)
+        return iter(getattr(self, "_" + name))
+
+    def get(self, i, name):
+        # one field of the i-th QSO, without building the whole QSO
+        if name in self._strings:
+            _, values, column = self._strings[name]
+            return values[column[i]]
+        value = getattr(self, "_" + name)[i]
+        return value if name == "timestamp" else value or None
+
+    def __getitem__(self, i):
+        return QSO(*(self.get(i, name) for name in QSO.__slots__))
+
+    def __iter__(self):
+        band, mode, station, stx, callsign, srx = (self.column(name) for name in self.STRING_COLUMNS)
+        columns = zip(band, mode, self._timestamp, station, self._rst_s, stx, callsign, self._rst_r, srx, self._freq)
+        for band, mode, timestamp, station, rst_s, stx, callsign, rst_r, srx, freq in columns:
+            yield QSO(band, mode, timestamp, station, rst_s or None, stx, callsign, rst_r or None, srx, freq or None)
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for _, column in self._columns())
+
+    def save(self, path, meta=None):
+        # A JSON header with the string tables and column offsets, followed
+        # by the raw column arrays, each 8-byte aligned so load() can map
+        # them in place. Mode enums are stored by name.
+        columns = []
+        offset = 0
+        for name, column in self._columns():
+            columns.append((name, column.typecode if isinstance(column, array.array) else column.format,
+                            offset, column.itemsize * len(column)))
+            offset += -(-columns[-1][3] // 8) * 8
+        header = json.dumps({
+            "version": CACHE_VERSION, "byteorder": sys.byteorder, "count": len(self), "meta": meta,
+            "tables": {name: [getattr(value, "name", value) for value in values]
+                       for name, (_, values, _) in self._strings.items()},
+            "columns": columns,
+        }).encode()
+        header += b" " * (-(len(_CACHE_MAGIC) + 8 + len(header)) % 8)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_CACHE_MAGIC + struct.pack("<Q", len(header)) + header)
+            for _, column in self._columns():
+                data = column.tobytes()
+                f.write(data + b"\0" * (-len(data) % 8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def read_header(cls, path):
+        with open(path, "rb") as f:
+            if f.read(len(_CACHE_MAGIC)) != _CACHE_MAGIC:
+                raise ValueError(f"{path}: not a QSO cache")
+            length, = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length))
+        if header["version"] != CACHE_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path}: incompatible QSO cache")
+        return header, len(_CACHE_MAGIC) + 8 + length
+
+    @classmethod
+    def load(cls, path, decode=None):
+        # The columns become views straight into the mapped file; nothing
+        # is copied until the log is appended to. decode maps a column name
+        # to a function turning stored table values back into objects.
+        header, start = cls.read_header(path)
+        with open(path, "rb") as f:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        log = cls()
+        log._readonly = True
+        decode = decode or {}
+        for name, typecode, offset, nbytes in header["columns"]:
+            column = data[start + offset:start + offset + nbytes].cast(typecode)
+            if name in log._strings:
+                values = header["tables"][name]
+                values = [decode[name](value) for value in values] if name in decode else [sys.intern(value) for value in values]
+                log._strings[name] = ({value: code for code, value in enumerate(values)}, values, column)
+            else:
+                setattr(log, "_" + name, column)
+        return log, header["meta"]
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest.hexdigest()}
+
+
+def load_cached(path, key, decode=None):
+    # The QSOLog and extra data cached next to path, or (None, None) if
+    # there is no cache or the file, its location or the key changed since.
+    cache_path = path + CACHE_SUFFIX
+    try:
+        header, _ = QSOLog.read_header(cache_path)
+        meta = header["meta"]
+        stat = os.stat(path)
+        source = meta["source"]
+        if (meta["key"] != key or source["path"] != os.path.abspath(path)
+                or source["size"] != stat.st_size or source["mtime_ns"] != stat.st_mtime_ns
+                # size and mtime can be fooled, the contents can't
+                or file_fingerprint(path)["hash"] != source["hash"]):
+            cache_stats["miss"] += 1
+            return None, None
+        log, meta = QSOLog.load(cache_path, decode)
+    except (OSError, ValueError, KeyError):
+        cache_stats["miss"] += 1
+        return None, None
+    cache_stats["hit"] += 1
+    return log, meta["extra"]
+
+
+def save_cached(path, log, key, fingerprint, extra=None):
+    # fingerprint is taken before parsing; a file that changed meanwhile
+    # isn't cached. A cache that can't be written is skipped silently.
+    try:
+        stat = os.stat(path)
+        if stat.st_size != fingerprint["size"] or stat.st_mtime_ns != fingerprint["mtime_ns"]:
+            return
+        log.save(path + CACHE_SUFFIX, {"key": key, "source": fingerprint, "extra": extra})
+    except OSError:
+        pass
@@ -1,15 +1,27 @@
 import argparse
+import array
+import bisect
 import collections
+import concurrent.futures
+import contextlib
 import datetime
 import enum
-import pandas as pd
+import hashlib
+import itertools
+import json
+import operator
 import re
+import sys
+import time
 import typing
 
+from qsorecord import QSO, QSOLog, cache_stats, file_fingerprint, from_epoch, load_cached, save_cached, to_epoch
+from timings import NO_TIMINGS, add_timing_arguments, instrument
 
 QSO_RE = re.compile("^QSO:\s+(\d+)\s+(CW|PH|DG|RY)\s+(\d\d\d\d-\d\d-\d\d)\s+(\d+)\s+([A-Z0-9]+)\s+(\d+)\s+(\w+)\s+([A-Z0-9]+)\s+(\d+)\s+(\w+)\s*\d?")
 
 Mode = enum.Enum("Mode", "CW PH DG".split())
+_MODES = {mode.name: mode for mode in Mode}
 
 SC_COUNTIES = set("ABBE AIKE ALLE ANDE BAMB BARN BEAU BERK CHOU CHAR CHES CHFD "
                   "CKEE CLRN COLL DARL DILL DORC EDGE FAIR FLOR GEOR GRWD GVIL "
@@ -21,8 +33,6 @@ US_STATES = set("AL AK AZ AR CA CO CT DC DE FL GA HI ID IL IN IA KS KY LA ME "
                 "MD MA MI MN MS MO MT NE NV NH NJ NM NY NC ND OH OK OR PA RI "
                 "SD TN TX UT VT VA WA WV WI WY".split())
 
-VALID_EXCHANGES = SC_COUNTIES.union(US_STATES).union(CANADIAN_PROVINCES).union({"DX"})
-
 BANDS = {
     (1800, 2000): "160m",
     (3500, 4000): "80m",
@@ -37,90 +47,411 @@ BONUS_STATIONS = ["W4CAE", "WW4SF"]
 START_TIME = datetime.datetime(2023, 2, 25, 15)
 END_TIME = datetime.datetime(2023, 2, 26, 2)
 
+PARSE_CHUNK_LINES = 20000
+
+
+class ExchangeCategory(typing.NamedTuple):
+    # A kind of exchange, like the states. points is a number or a dict of
+    # points by mode name. label names the category in report titles and
+    # missing the "Missing ..." list; also_counts_as names a category that
+    # working any of these also counts one towards in the totals.
+    name: str
+    values: frozenset
+    points: typing.Any = 2
+    multiplier: bool = True
+    label: typing.Optional[str] = None
+    missing: typing.Optional[str] = None
+    also_counts_as: typing.Optional[str] = None
+
+
+SCQP_EXCHANGES = [
+    ExchangeCategory("dx", frozenset({"DX"}), 4, multiplier=False, label="DX"),
+    ExchangeCategory("states", frozenset(US_STATES), 4, label="States"),
+    ExchangeCategory("provinces", frozenset(CANADIAN_PROVINCES), 4, label="Provinces"),
+    ExchangeCategory("sc counties", frozenset(SC_COUNTIES), 2, label="SC Counties", missing="Counties",
+                     also_counts_as="states"),
+]
+
+# QSO attributes that multiplier and bonus keys can be built from
+KEY_FIELDS = {"callsign": "callsign", "band": "band", "mode": "mode", "exchange": "srx"}
+
+
+class ContestRules:
+    # Contest specific parameters used by the parser, Scorer and StatsKeeper,
+    # compiled into lookup tables: a bisect table from frequency to band and
+    # dicts from exchange to category, points and missing lists. Multiplier
+    # and bonus keys are tuples of the QSO fields named in multiplier and
+    # bonus_key. Subclass and override qso_points() for scoring that a table
+    # can't express, or load() the rules from a YAML or TOML file.
+
+    def __init__(self, name, start_time, end_time, bonus_stations=(), bonus_points=250, bands=BANDS,
+                 exchanges=SCQP_EXCHANGES, multiplier=("mode", "exchange"),
+                 bonus_key=("callsign", "band", "mode", "exchange")):
+        self.name = name
+        self.start_time = start_time
+        self.end_time = end_time
+        self.start_epoch = to_epoch(start_time)
+        self.end_epoch = to_epoch(end_time)
+        self.bonus_stations = frozenset(bonus_stations)
+        self.bonus_points = bonus_points
+
+        edges = sorted(bands)
+        self._band_lower_edges = [low for low, _ in edges]
+        self._band_upper_edges = [high for _, high in edges]
+        self._band_names = [bands[edge] for edge in edges]
+
+        self.categories = [category._replace(label=category.label or category.name.title(),
+                                             missing=category.missing or category.label or category.name.title())
+                           for category in exchanges]
+        self.mult_categories = [category for category in self.categories if category.multiplier]
+        mult_names = {category.name for category in self.mult_categories}
+        for category in self.categories:
+            if category.also_counts_as is not None and (not category.multiplier or category.also_counts_as not in mult_names):
+                raise RuntimeError(f"Invalid contest rules: {category.name} can't also count as {category.also_counts_as}, "
+                                   f"both have to be multiplier categories")
+        # the first category listing an exchange wins
+        self.category_of = {}
+        self._exchange_points = {}
+        self._exchange_mode_points = {}
+        for category in self.categories:
+            # points by mode have to cover every mode, or scoring fails partway through a log
+            if isinstance(category.points, dict) and set(category.points) != set(Mode.__members__):
+                raise RuntimeError(f"Invalid contest rules: {category.name} points need the modes "
+                                   f"{', '.join(Mode.__members__)}, got {', '.join(map(str, category.points))}")
+            for value in category.values:
+                if value in self.category_of:
+                    continue
+                self.category_of[value] = category.name
+                if isinstance(category.points, dict):
+                    for mode, points in category.points.items():
+                        self._exchange_mode_points[value, Mode[mode]] = points
+                else:
+                    self._exchange_points[value] = category.points
+        self.valid_exchanges = frozenset(self.category_of)
+        self.mult_exchanges = frozenset(value for category in self.mult_categories for value in category.values)
+
+        self.mult_key = operator.attrgetter(*(KEY_FIELDS[field] for field in multiplier))
+        self.bonus_key = operator.attrgetter(*(KEY_FIELDS[field] for field in bonus_key))
+
+        # what parsing depends on, for the parse cache
+        self.parse_key = hashlib.blake2b(repr((self.start_epoch, self.end_epoch, edges, self._band_names,
+                                               sorted(self.valid_exchanges))).encode(), digest_size=16).hexdigest()
+
+    def band(self, freq):
+        i = bisect.bisect_right(self._band_lower_edges, freq) - 1
+        if i < 0 or freq > self._band_upper_edges[i]:
+            raise RuntimeError(f"Invalid frequency: {freq}")
+        return self._band_names[i]
+
+    def qso_points(self, qso):
+        points = self._exchange_points.get(qso.srx)
+        if points is None:
+            points = self._exchange_mode_points[qso.srx, qso.mode]
+        return points
+
+    @classmethod
+    def from_dict(cls, data):
+        # see contests/scqp_2023.yaml for the layout
+        def timestamp(value):
+            if isinstance(value, str):
+                value = datetime.datetime.fromisoformat(value)
+            if value.tzinfo is not None:
+                value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            return value
+
+        def values(value):
+            # "AL AK AZ" or a list; YAML reads a bare ON as a boolean
+            values = value.split() if isinstance(value, str) else value
+            for v in values:
+                if not isinstance(v, str):
+                    raise RuntimeError(f"Exchange {v!r} is not a string, quote it")
+            return frozenset(values)
+
+        try:
+            exchanges = [
+                ExchangeCategory(name, values(category["values"]), category.get("points", 2),
+                                 category.get("multiplier", True), category.get("label"), category.get("missing"),
+                                 category.get("also_counts_as"))
+                for name, category in data["exchanges"].items()
+            ]
+            bonus = data.get("bonus", {})
+            return cls(
+                data["name"], timestamp(data["start"]), timestamp(data["end"]),
+                bonus.get("stations", ()), bonus.get("points", 0),
+                {tuple(edges): band for band, edges in data["bands"].items()},
+                exchanges,
+                tuple(data.get("multiplier", ("mode", "exchange"))),
+                tuple(bonus.get("key", ("callsign", "band", "mode", "exchange"))),
+            )
+        except (KeyError, TypeError, ValueError) as ex:
+            raise RuntimeError(f"Invalid contest rules: {ex!r}")
+
+    @classmethod
+    def load(cls, path):
+        # YAML needs PyYAML, TOML files (.toml) only the standard library
+        if path.endswith(".toml"):
+            import tomllib
+            with open(path, "rb") as f:
+                return cls.from_dict(tomllib.load(f))
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is needed to read YAML contest rules")
+        with open(path) as f:
+            return cls.from_dict(yaml.safe_load(f))
+
+
+SCQP_2023 = ContestRules("SCQP 2023", START_TIME, END_TIME, BONUS_STATIONS)
+
+
+class _CategoricalColumn:
+    # Append-only column of interned values stored as small integer codes.
+
+    def __init__(self, typecode="H"):
+        self._codes = array.array(typecode)
+        self._index = {}
+        self.categories = []
+
+    def __len__(self):
+        return len(self._codes)
+
+    def append(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(value)
+        self._codes.append(code)
+
+    @property
+    def codes(self):
+        return self._codes
+
 
 class StatsKeeper:
-    def __init__(self):
-        self._rows = []
+    # The exchange columns, multipliers and missing lists come from the
+    # contest rules: one column per exchange category, multipliers and
+    # missing lists for the multiplier categories.
+
+    def __init__(self, rules=SCQP_2023):
+        self._rules = rules
+        self._band = _CategoricalColumn("B")
+        self._mode = _CategoricalColumn("B")
+        self._srx = _CategoricalColumn("H")
         self._dup_count = 0
+        self._mult_keys = set()
+        self._exchange_columns = [category.name for category in rules.categories]
+        self._mult_columns = [category.name for category in rules.mult_categories]
+        self._missing = {category.missing: set(category.values) for category in rules.mult_categories}
+        self._missing_of = collections.defaultdict(list)
+        for category in rules.mult_categories:
+            for value in category.values:
+                self._missing_of[value].append(self._missing[category.missing])
+        self._title = "/".join(category.label for category in rules.mult_categories)
+
+    def exchange_column(self, srx):
+        return self._rules.category_of.get(srx)
+
+    def _add_also_counted(self, totals):
+        # totals by multiplier column name
+        for category in self._rules.mult_categories:
+            if category.also_counts_as and totals[category.name] > 0:
+                totals[category.also_counts_as] += 1
 
     def record_dup(self, qso):
         self._dup_count += 1
 
     def record(self, qso):
-        if qso.srx == "DX":
-            srx_cat = "dx"
-        elif qso.srx in US_STATES:
-            srx_cat = "states"
-        elif qso.srx in CANADIAN_PROVINCES:
-            srx_cat = "provinces"
-        elif qso.srx in SC_COUNTIES:
-            srx_cat = "sc counties"
-
-        self._rows.append({"band": qso.band, "mode": qso.mode.name, srx_cat: qso.srx})
+        self._band.append(qso.band)
+        self._mode.append(qso.mode.name)
+        self._srx.append(qso.srx)
+
+        if qso.srx in self._rules.mult_exchanges:
+            self._mult_keys.add(self._rules.mult_key(qso))
+        for missing in self._missing_of.get(qso.srx, ()):
+            missing.discard(qso.srx)
+
+    def _build_frame(self):
+        import numpy as np
+        import pandas as pd
+
+        def values(column, categories=None):
+            codes = np.frombuffer(column.codes, dtype=column.codes.typecode) if column.codes else np.empty(0, dtype=int)
+            return np.array(categories or column.categories, dtype=object)[codes]
+
+        srx = values(self._srx)
+        srx_columns = values(self._srx, [self.exchange_column(e) for e in self._srx.categories])
+        columns = {"band": values(self._band), "mode": values(self._mode)}
+        for column in self._exchange_columns:
+            columns[column] = np.where(srx_columns == column, srx, np.nan)
+        return pd.DataFrame(columns)
 
     def process(self):
-        self._all = pd.concat((pd.DataFrame([r], columns=["band", "mode", "dx", "states", "provinces", "sc counties"]) for r in self._rows), ignore_index=True)
-        self._dx = self._all.loc[~self._all.dx.isna()].drop(["states", "provinces", "sc counties"], axis=1)
-        self._mults = self._all.loc[self._all.dx.isna()].drop(["dx"], axis=1)
-
-        self._qsos_by_band = self._all.drop(["mode", "dx", "states", "provinces", "sc counties"], axis=1).value_counts()
-        self._qsos_by_mode = self._all.drop(["band", "dx", "states", "provinces", "sc counties"], axis=1).value_counts()
-        self._qsos_by_band_mode = self._all.drop(["dx", "states", "provinces", "sc counties"], axis=1).value_counts()
-        self._dx_band_mode = pd.DataFrame(self._dx.groupby(["band", "mode"])["dx"].count())
-        self._dx_band_mode = self._dx_band_mode.reindex(pd.MultiIndex.from_tuples(self._dx_band_mode.index, name=("band", "mode"))).unstack("band").fillna(0)
-        self._dx_band_mode.dx = self._dx_band_mode.dx.astype(int)
-        self._dx_band_mode["Total"] = self._dx_band_mode.sum(axis=1)
-        self._dx_band_mode.loc["Total"] = self._dx_band_mode.sum(axis=0)
-
-        self._mults_by_band = self._mults.drop(["mode"], axis=1).drop_duplicates().set_index(["band"]).groupby(["band"]).count().swapaxes(axis1=1, axis2=0)
-        self._mults_by_mode = self._mults.drop(["band"], axis=1).drop_duplicates().set_index(["mode"]).groupby(["mode"]).count().swapaxes(axis1=1, axis2=0)
-        self._mults_by_band_mode = self._mults.drop_duplicates().set_index(["band", "mode"]).groupby(["band", "mode"]).count().swapaxes(axis1=1, axis2=0)
-        self._mults_no_breakdown = pd.DataFrame(self._mults.drop(["band", "mode"], axis=1).drop_duplicates().count(), columns=["Total"]).swapaxes(axis1=1, axis2=0)
-        has_sc = 1 if self._mults_no_breakdown.loc["Total", "sc counties"] > 0 else 0
-        self._mults_no_breakdown.loc["Total", "states"] += has_sc
-
-        self._missing_states = US_STATES.copy()
-        self._missing_provinces = CANADIAN_PROVINCES.copy()
-        self._missing_counties = SC_COUNTIES.copy()
-        
-        self._missing_states.difference_update( self._all["states"].drop_duplicates())
-        self._missing_provinces.difference_update( self._all["provinces"].drop_duplicates())
-        self._missing_counties.difference_update( self._all["sc counties"].drop_duplicates())
+        # pandas is only imported when the tabular report is built
+        import pandas as pd
+
+        # the DX summary covers the exchanges that aren't multipliers
+        other_columns = [column for column in self._exchange_columns if column not in self._mult_columns]
+        dx = "/".join(other_columns) or "dx"
+        self._all = self._build_frame()
+        is_mult = self._all[other_columns].isna().all(axis=1)
+        self._dx = self._all.loc[~is_mult].drop(self._mult_columns, axis=1)
+        self._mults = self._all.loc[is_mult].drop(other_columns, axis=1)
+
+        self._qsos_by_band = self._all.drop(["mode"] + self._exchange_columns, axis=1).value_counts()
+        self._qsos_by_mode = self._all.drop(["band"] + self._exchange_columns, axis=1).value_counts()
+        self._qsos_by_band_mode = self._all.drop(self._exchange_columns, axis=1).value_counts()
+        # no DX summary for rules without other exchanges or logs without DX QSOs
+        self._dx_band_mode = None
+        if len(self._dx):
+            self._dx_band_mode = pd.DataFrame(self._dx.groupby(["band", "mode"]).size().rename(dx))
+            self._dx_band_mode = self._dx_band_mode.reindex(pd.MultiIndex.from_tuples(self._dx_band_mode.index, name=("band", "mode"))).unstack("band").fillna(0)
+            self._dx_band_mode[dx] = self._dx_band_mode[dx].astype(int)
+            self._dx_band_mode["Total"] = self._dx_band_mode.sum(axis=1)
+            self._dx_band_mode.loc["Total"] = self._dx_band_mode.sum(axis=0)
+
+        self._mults_by_band = self._mults.drop(["mode"], axis=1).drop_duplicates().set_index(["band"]).groupby(["band"]).count().T
+        self._mults_by_mode = self._mults.drop(["band"], axis=1).drop_duplicates().set_index(["mode"]).groupby(["mode"]).count().T
+        self._mults_by_band_mode = self._mults.drop_duplicates().set_index(["band", "mode"]).groupby(["band", "mode"]).count().T
+        self._mults_no_breakdown = pd.DataFrame(self._mults.drop(["band", "mode"], axis=1).drop_duplicates().count(), columns=["Total"]).T
+        totals = self._mults_no_breakdown.loc["Total"].to_dict()
+        self._add_also_counted(totals)
+        for column, total in totals.items():
+            self._mults_no_breakdown.loc["Total", column] = total
 
     @property
     def multiplier(self):
-        return len(self._mults.drop_duplicates(["mode", "states", "provinces", "sc counties"]))
+        return len(self._mult_keys)
+
+    def summary(self):
+        # pandas-free subset of the process()/display() tables
+        def counts(column):
+            return {column.categories[code]: count for code, count in collections.Counter(column.codes).items()}
+
+        return {
+            "qsos_by_band": counts(self._band),
+            "qsos_by_mode": counts(self._mode),
+            "dups": self._dup_count,
+        } | {
+            "missing_" + label.lower().replace(" ", "_"): sorted(missing) for label, missing in self._missing.items()
+        }
 
     @property
     def qso_count(self):
-        return len(self._all) + self._dup_count
+        return len(self._srx) + self._dup_count
 
     @property
     def unique_count(self):
-        return len(self._all)
+        return len(self._srx)
 
     def display(self):
         print(f"\nQSOs By Band\n============\n{self._qsos_by_band}")
         print(f"\nQSOs By Mode\n============\n{self._qsos_by_mode}")
         print(f"\nQSOs By Band/Mode\n=================\n{self._qsos_by_band_mode}")
-        print(f"\nDX Summary\n==========\n{self._dx_band_mode}")
-        print(f"\nStates/Provinces/SC Counties\n============================\n{self._mults_no_breakdown}")
-        print(f"\nStates/Provinces/SC Counties By Band\n====================================\n{self._mults_by_band}")
-        print(f"\nStates/Provinces/SC Counties By Mode\n====================================\n{self._mults_by_mode}")
-        print(f"\nStates/Provinces/SC Counties By Band/Mode\n==========================================\n{self._mults_by_band_mode}")
-        print(f"\nMissing States: {', '.join(sorted(self._missing_states))}")
-        print(f"\nMissing Provinces: {', '.join(sorted(self._missing_provinces))}")
-        print(f"\nMissing Counties: {', '.join(sorted(self._missing_counties))}")
+        if self._dx_band_mode is not None:
+            print(f"\nDX Summary\n==========\n{self._dx_band_mode}")
+        self.display_mults(self._mults_no_breakdown, self._mults_by_band, self._mults_by_mode, self._mults_by_band_mode)
+        self.display_missing()
+
+    def display_mults(self, *tables):
+        # the By Band/Mode underline has always been one longer than its title
+        for (suffix, extra), table in zip((("", 0), (" By Band", 0), (" By Mode", 0), (" By Band/Mode", 1)), tables):
+            title = self._title + suffix
+            print(f"\n{title}\n{'=' * (len(title) + extra)}\n{table}")
+
+    def display_missing(self):
+        for label, missing in self._missing.items():
+            print(f"\nMissing {label}: {', '.join(sorted(missing))}")
+
+
+def _format_table(columns, rows):
+    labels = [label for label, _ in rows]
+    label_width = max(map(len, labels), default=0)
+    widths = [max([len(str(column))] + [len(str(values[i])) for _, values in rows]) for i, column in enumerate(columns)]
+    lines = [" " * label_width + "".join(f"  {column:>{width}}" for column, width in zip(columns, widths))]
+    for label, values in rows:
+        lines.append(f"{label:<{label_width}}" + "".join(f"  {value:>{width}}" for value, width in zip(values, widths)))
+    return "\n".join(lines)
+
+
+class PlainStatsKeeper(StatsKeeper):
+    # Same report as StatsKeeper built from dicts and Counters over the
+    # distinct (band, mode, exchange) combinations instead of pandas, which
+    # keeps startup and memory down for normal-sized logs.
+
+    def process(self):
+        combos = collections.Counter(zip(self._band.codes, self._mode.codes, self._srx.codes))
+        rows = [(self._band.categories[b], self._mode.categories[m], self._srx.categories[e], count)
+                for (b, m, e), count in combos.items()]
+        column_of = {srx: self.exchange_column(srx) for srx in self._srx.categories}
+
+        by_band, by_mode, by_band_mode = collections.Counter(), collections.Counter(), collections.Counter()
+        dx = collections.Counter()
+        mults = collections.defaultdict(set)
+        for band, mode, srx, count in rows:
+            by_band[band] += count
+            by_mode[mode] += count
+            by_band_mode[band, mode] += count
+            if column_of[srx] not in self._mult_columns:
+                dx[band, mode] += count
+            else:
+                for key in ((), (band,), (mode,), (band, mode)):
+                    mults[key].add((column_of[srx], srx))
+
+        def mult_counts(key):
+            counts = collections.Counter(column for column, _ in mults[key])
+            return [counts[column] for column in self._mult_columns]
+
+        def sorted_counts(counter):
+            return sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+
+        self._qsos_by_band = sorted_counts(by_band)
+        self._qsos_by_mode = sorted_counts(by_mode)
+        self._qsos_by_band_mode = sorted_counts(by_band_mode)
+
+        dx_bands = sorted({band for band, _ in dx})
+        dx_modes = sorted({mode for _, mode in dx})
+        dx_rows = [(mode, [dx[band, mode] for band in dx_bands]) for mode in dx_modes]
+        dx_rows = [(mode, counts + [sum(counts)]) for mode, counts in dx_rows]
+        dx_rows.append(("Total", [sum(column) for column in zip(*(counts for _, counts in dx_rows))]))
+        self._dx_band_mode = (dx_bands + ["Total"], dx_rows) if dx else None
+
+        totals = dict(zip(self._mult_columns, mult_counts(())))
+        self._add_also_counted(totals)
+        self._mults_no_breakdown = (self._mult_columns, [("Total", list(totals.values()))])
+
+        def mults_table(keys):
+            keys = sorted(keys)
+            counts = [mult_counts(key) for key in keys]
+            return (["/".join(key) for key in keys],
+                    [(column, [c[i] for c in counts]) for i, column in enumerate(self._mult_columns)])
+
+        self._mults_by_band = mults_table(key for key in mults if len(key) == 1 and key[0] in by_band)
+        self._mults_by_mode = mults_table(key for key in mults if len(key) == 1 and key[0] in by_mode)
+        self._mults_by_band_mode = mults_table(key for key in mults if len(key) == 2)
+
+    def display(self):
+        def counts(rows):
+            return _format_table(["count"], [(" ".join(key) if isinstance(key, tuple) else key, [count]) for key, count in rows])
+
+        print(f"\nQSOs By Band\n============\n{counts(self._qsos_by_band)}")
+        print(f"\nQSOs By Mode\n============\n{counts(self._qsos_by_mode)}")
+        print(f"\nQSOs By Band/Mode\n=================\n{counts(self._qsos_by_band_mode)}")
+        if self._dx_band_mode is not None:
+            print(f"\nDX Summary\n==========\n{_format_table(*self._dx_band_mode)}")
+        self.display_mults(*(_format_table(*table) for table in (self._mults_no_breakdown, self._mults_by_band,
+                                                                   self._mults_by_mode, self._mults_by_band_mode)))
+        self.display_missing()
 
 
 class Scorer:
     # Does not support STATION working from multiple counties
 
-    def __init__(self):
+    def __init__(self, rules=SCQP_2023, stats=None):
+        self._rules = rules
         self._call_band_mode_to_exch = collections.defaultdict(set)
         self._qso_points = 0
         self._bonuses = set()
-        self._stats = StatsKeeper()
+        self._stats = stats if stats is not None else StatsKeeper(rules)
 
     def record(self, qso):
         oldexch = self._call_band_mode_to_exch[qso.callsign, qso.band, qso.mode]
@@ -135,36 +466,72 @@ class Scorer:
         oldexch.add(qso.srx)
         self._stats.record(qso)
 
-        if len(qso.srx) == 2:
-            # non-SC contact
-            self._qso_points += 4
-        else:
-            self._qso_points += 2
+        self._qso_points += self._rules.qso_points(qso)
 
-        if qso.callsign in BONUS_STATIONS:
-            self._bonuses.add((qso.callsign, qso.band, qso.mode, qso.srx))
+        if qso.callsign in self._rules.bonus_stations:
+            self._bonuses.add(self._rules.bonus_key(qso))
 
-    def dump(self):
-        self._stats.process()
-        multiplier = self._stats.multiplier
-        bonus_points = 250 * len(self._bonuses)
-        score = self._qso_points * multiplier + bonus_points
+    @property
+    def bonus_points(self):
+        return self._rules.bonus_points * len(self._bonuses)
+
+    @property
+    def score(self):
+        return self._qso_points * self._stats.multiplier + self.bonus_points
+
+    def result(self, path, station=None, messages=(), error=None):
+        return EntryScore(
+            path=path,
+            station=station,
+            qsos=self._stats.qso_count,
+            uniques=self._stats.unique_count,
+            qso_points=self._qso_points,
+            multiplier=self._stats.multiplier,
+            bonus_points=self.bonus_points,
+            score=self.score,
+            stats=self._stats.summary(),
+            messages=list(messages),
+            error=error,
+        )
+
+    def display_score(self):
         print(f"QSOs: {self._stats.qso_count}  Uniques: {self._stats.unique_count}")
-        print(f"QSO POINTS: {self._qso_points}  MULTIPLIER: {multiplier}  BONUS POINTS: {bonus_points}")
-        print(f"SCORE: {score}")
+        print(f"QSO POINTS: {self._qso_points}  MULTIPLIER: {self._stats.multiplier}  BONUS POINTS: {self.bonus_points}")
+        print(f"SCORE: {self.score}")
+
+    def display_live(self):
+        # everything shown here is maintained per QSO by record(), no process() needed
+        print(f"\n=== {datetime.datetime.now().strftime('%H:%M:%S')} ===")
+        self.display_score()
+        self._stats.display_missing()
+
+    def process(self):
+        self._stats.process()
+
+    def display(self):
+        self.display_score()
         self._stats.display()
 
+    def dump(self):
+        self.process()
+        self.display()
+
+
+class EntryScore(typing.NamedTuple):
+    path: str
+    station: typing.Optional[str]
+    qsos: int
+    uniques: int
+    qso_points: int
+    multiplier: int
+    bonus_points: int
+    score: int
+    stats: dict
+    messages: list
+    error: typing.Optional[str]
 
-class QSO(typing.NamedTuple):
-    band: str
-    mode: Mode
-    timestamp: datetime.datetime
-    station: str
-    rst_s: int
-    stx: str
-    callsign: str
-    rst_r: int
-    srx: str
+    def to_json(self, **kwargs):
+        return json.dumps(self._asdict(), **kwargs)
 
 
 def validate_rst(rst):
@@ -176,52 +543,321 @@ def validate_rst(rst):
             raise RuntimeError(f"Invalid RST: {rst}")
 
 
-def validate_exch(exch):
-    if exch not in VALID_EXCHANGES:
+def validate_exch(exch, rules=SCQP_2023):
+    if exch not in rules.valid_exchanges:
         raise RuntimeError(f"Invalid exchange: {exch}")
 
 
-def load_qsos(filename):
+def validate_qso(rst_s, rst_r, stx, srx, rules=SCQP_2023):
+    validate_rst(rst_s)
+    validate_rst(rst_r)
+    validate_exch(stx, rules)
+    validate_exch(srx, rules)
+
+
+def _mode(name):
+    mode = _MODES.get(name)
+    if mode is None:
+        raise RuntimeError(f"Invalid mode: {name}")
+    return mode
+
+
+def parse_qso_line_regex(line, rules=SCQP_2023, validate=validate_qso):
+    line = line.strip()
+    m = QSO_RE.match(line)
+    if not m:
+        return None
+    (freq, mode, dt, tm, station, rst_s, stx, callsign, rst_r, srx) = m.groups()
+    freq = int(freq)
+    band = rules.band(freq)
+    timestamp = datetime.datetime.strptime(f"{dt} {tm}", "%Y-%m-%d %H%M")
+    if timestamp < rules.start_time or timestamp > rules.end_time:
+        print("Ignoring QSO: out of timerange ", timestamp)
+        return None
+
+    rst_s = int(rst_s)
+    rst_r = int(rst_r)
+
+    validate(rst_s, rst_r, stx, srx, rules)
+    return QSO(band, _mode(mode), to_epoch(timestamp), station, rst_s, stx, callsign, rst_r, srx, freq)
+
+
+_QSO_MODES = {"CW", "PH", "DG", "RY"}
+_DIGITS = "0123456789"
+_CALL_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ" + _DIGITS
+
+_timestamps = {}
+
+
+def _timestamp(dt, tm):
+    by_time = _timestamps.get(dt)
+    if by_time is None:
+        by_time = _timestamps[dt] = {}
+    timestamp = by_time.get(tm)
+    if timestamp is None:
+        try:
+            timestamp = datetime.datetime(int(dt[:4]), int(dt[5:7]), int(dt[8:]), int(tm[:2]), int(tm[2:]))
+        except ValueError:
+            # let strptime report the error exactly as the regex path does
+            timestamp = datetime.datetime.strptime(f"{dt} {tm}", "%Y-%m-%d %H%M")
+        timestamp = by_time[tm] = to_epoch(timestamp)
+    return timestamp
+
+
+def parse_qso_line(line, rules=SCQP_2023, validate=validate_qso):
+    # Token-based equivalent of parse_qso_line_regex(). Any line whose tokens
+    # don't have the plain shape the regex expects is handed to the regex
+    # path, so both accept, ignore and reject exactly the same lines.
+    tokens = line.split()
+    if len(tokens) < 11 or tokens[0] != "QSO:":
+        return parse_qso_line_regex(line, rules, validate)
+    (_, freq, mode, dt, tm, station, rst_s, stx, callsign, rst_r, srx) = tokens[:11]
+    if (freq.strip(_DIGITS) or mode not in _QSO_MODES
+            or len(dt) != 10 or dt[4] != "-" or dt[7] != "-" or dt.replace("-", "").strip(_DIGITS)
+            or len(tm) != 4 or tm.strip(_DIGITS)
+            or station.strip(_CALL_CHARS) or callsign.strip(_CALL_CHARS)
+            or rst_s.strip(_DIGITS) or rst_r.strip(_DIGITS)
+            or not stx.isalnum() or not srx.isalnum()):
+        return parse_qso_line_regex(line, rules, validate)
+
+    freq = int(freq)
+    band = rules.band(freq)
+    timestamp = _timestamp(dt, tm)
+    if timestamp < rules.start_epoch or timestamp > rules.end_epoch:
+        print("Ignoring QSO: out of timerange ", from_epoch(timestamp))
+        return None
+
+    rst_s = int(rst_s)
+    rst_r = int(rst_r)
+
+    validate(rst_s, rst_r, stx, srx, rules)
+    return QSO(band, _mode(mode), timestamp, sys.intern(station), rst_s, sys.intern(stx),
+               sys.intern(callsign), rst_r, sys.intern(srx), freq)
+
+
+def parse_qsos(lines, first_line=1, parse_line=parse_qso_line, rules=SCQP_2023, timings=NO_TIMINGS):
+    # validation is timed as its own stage, within the time spent parsing
+    validate = timings.wrap("validate", validate_qso)
+    for i, line in enumerate(lines, first_line):
+        try:
+            qso = parse_line(line, rules, validate)
+        except Exception as ex:
+            raise RuntimeError(f"Exception on line {i}: {ex}")
+        if qso is not None:
+            yield qso
+
+
+def load_qsos(filename, rules=SCQP_2023, cache=False, timings=NO_TIMINGS):
+    if cache:
+        yield from _load_qsos_cached(filename, rules, timings)
+        return
     with open(filename) as f:
-        for i, line in enumerate(f):
-            try:
-                line = line.strip()
-                m = QSO_RE.match(line)
-                if not m:
-                    continue
-                (freq, mode, dt, tm, station, rst_s, stx, callsign, rst_r, srx) = m.groups()
-                freq = int(freq)
-                for freqs, band in BANDS.items():
-                    if freq >= freqs[0] and freq <= freqs[1]:
-                        break
+        yield from parse_qsos(f, rules=rules, timings=timings)
+
+
+def _load_qsos_cached(filename, rules, timings):
+    # The parsed QSOs and the messages printed while parsing them go to a
+    # sidecar file, which is used for as long as neither the log nor the
+    # rules change. Logs with errors aren't cached.
+    key = {"parser": "scqpscore", "rules": rules.parse_key}
+    log, extra = load_cached(filename, key, decode={"mode": Mode.__getitem__})
+    if log is None:
+        fingerprint = file_fingerprint(filename)
+        with open(filename) as f:
+            events, error = _parse_chunk(f, 1, rules, timings)
+        if error is None:
+            # each message is stored with the number of QSOs before it
+            log = QSOLog()
+            messages = []
+            for event in events:
+                if isinstance(event, str):
+                    messages.append((len(log), event))
                 else:
-                    raise RuntimeError(f"Invalid frequency: {freq}")
-                timestamp = datetime.datetime.strptime(f"{dt} {tm}", "%Y-%m-%d %H%M")
-                if timestamp < START_TIME or timestamp > END_TIME:
-                    print("Ignoring QSO: out of timerange ", timestamp)
-                    continue
-
-                rst_s = int(rst_s)
-                rst_r = int(rst_r)
+                    log.append(event)
+            save_cached(filename, log, key, fingerprint, {"messages": messages})
+        yield from _replay_chunk((events, error))
+        return
+
+    messages = collections.deque(extra["messages"])
+    for i, qso in enumerate(log):
+        while messages and messages[0][0] == i:
+            sys.stdout.write(messages.popleft()[1])
+        yield qso
+    for _, text in messages:
+        sys.stdout.write(text)
+
+
+class _EventRecorder:
+    # Stands in for stdout in parse workers so printed messages can be
+    # replayed in their original position relative to the parsed QSOs.
+
+    def __init__(self, events):
+        self._events = events
+
+    def write(self, text):
+        self._events.append(text)
+
+    def flush(self):
+        pass
+
+
+def _parse_chunk(lines, first_line, rules, timings=NO_TIMINGS):
+    events = []
+    error = None
+    with contextlib.redirect_stdout(_EventRecorder(events)):
+        try:
+            events.extend(parse_qsos(lines, first_line, rules=rules, timings=timings))
+        except RuntimeError as ex:
+            error = ex
+    return events, error
+
+
+def _read_chunks(filenames, chunk_lines):
+    for filename in filenames:
+        with open(filename) as f:
+            first_line = 1
+            while lines := list(itertools.islice(f, chunk_lines)):
+                yield lines, first_line
+                first_line += len(lines)
+
+
+def _replay_chunk(result):
+    events, error = result
+    for event in events:
+        if isinstance(event, str):
+            sys.stdout.write(event)
+        else:
+            yield event
+    if error is not None:
+        raise error
+
+
+def load_qsos_parallel(filenames, jobs, chunk_lines=PARSE_CHUNK_LINES, rules=SCQP_2023):
+    # Same QSO stream, messages and errors as chaining load_qsos() over the
+    # files, but each chunk of lines is parsed and validated in a worker.
+    executor = concurrent.futures.ProcessPoolExecutor(jobs)
+    try:
+        pending = collections.deque()
+        for lines, first_line in _read_chunks(filenames, chunk_lines):
+            pending.append(executor.submit(_parse_chunk, lines, first_line, rules))
+            if len(pending) > 2 * jobs:
+                yield from _replay_chunk(pending.popleft().result())
+        while pending:
+            yield from _replay_chunk(pending.popleft().result())
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def score_entry(path, rules=SCQP_2023, cache=False):
+    # Score one log without printing anything; warnings end up in messages.
+    events = []
+    error = None
+    station = None
+    scorer = Scorer(rules)
+    with contextlib.redirect_stdout(_EventRecorder(events)):
+        try:
+            for qso in load_qsos(path, rules, cache):
+                station = station or qso.station
+                scorer.record(qso)
+        except (OSError, RuntimeError) as ex:
+            error = str(ex)
+    return scorer.result(path, station, "".join(events).splitlines(), error)
+
+
+def score_entries(paths, rules=SCQP_2023, cache=False):
+    return [score_entry(path, rules, cache) for path in paths]
+
+
+def rank_entries(results):
+    # highest score first, entries that failed to load last
+    return sorted(results, key=lambda result: (result.error is not None, -result.score))
+
+
+def follow_qsos(scorer, filename, interval, poll_interval=0.5, rules=SCQP_2023):
+    # Tail a Cabrillo log that is still being written, scoring each QSO as
+    # its line is completed, until END-OF-LOG: is seen.
+    line_number = 0
+    pending = ""
+    next_display = time.monotonic() + interval
 
-                validate_rst(rst_s)
-                validate_rst(rst_r)
-                validate_exch(stx)
-                validate_exch(srx)
-                yield QSO(band, getattr(Mode, mode), timestamp, station, rst_s, stx, callsign, rst_r, srx)
-            except Exception as ex:
-                raise RuntimeError(f"Exception on line {i + 1}: {ex}")
+    with open(filename) as f:
+        while True:
+            pending += f.readline()
+            if pending.startswith("END-OF-LOG:"):
+                break
+            if pending.endswith("\n"):
+                line_number += 1
+                try:
+                    for qso in parse_qsos([pending], line_number, rules=rules):
+                        scorer.record(qso)
+                except RuntimeError as ex:
+                    print(f"WARNING: {ex}")
+                pending = ""
+            else:
+                # caught up with the writer, possibly mid-line
+                time.sleep(poll_interval)
+
+            if time.monotonic() >= next_display:
+                scorer.display_live()
+                next_display = time.monotonic() + interval
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--file", nargs="+")
+    parser.add_argument("--follow", action="store_true")
+    parser.add_argument("--interval", type=float, default=30.0)
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument("--entries", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--report", default="pandas", choices=["pandas", "plain"])
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--rules")
+    add_timing_arguments(parser)
     args = parser.parse_args()
-
-    scorer = Scorer()
-
-    for f in args.file:
-        for qso in load_qsos(f):
-            scorer.record(qso)
-
-    scorer.dump()
+    if args.json and not args.entries:
+        parser.error("--json needs --entries")
+
+    rules = ContestRules.load(args.rules) if args.rules else SCQP_2023
+
+    with instrument(args) as timings:
+        if args.entries:
+            with timings.stage("score"):
+                results = rank_entries(score_entries(args.file, rules, args.cache))
+            timings.count("entries", len(results))
+            timings.count("qsos", sum(result.qsos for result in results))
+            with timings.stage("render"):
+                if args.json:
+                    print(json.dumps([result._asdict() for result in results], indent=2))
+                else:
+                    for rank, result in enumerate(results, 1):
+                        if result.error:
+                            print(f"  -  {result.station or '':<10} {result.path}: {result.error}")
+                        else:
+                            print(f"{rank:>3}  {result.station or '':<10} {result.score:>10}  QSOs: {result.uniques}  MULTIPLIER: {result.multiplier}  {result.path}")
+            sys.exit(0)
+
+        scorer = Scorer(rules, PlainStatsKeeper(rules) if args.report == "plain" else None)
+        record = timings.wrap("score", scorer.record)
+
+        if args.follow:
+            if len(args.file) != 1:
+                parser.error("--follow takes exactly one file")
+            try:
+                follow_qsos(scorer, args.file[0], args.interval, rules=rules)
+            except KeyboardInterrupt:
+                pass
+        elif args.jobs > 1 and not args.cache:
+            for qso in timings.iterate("parse", load_qsos_parallel(args.file, args.jobs, rules=rules), "qsos"):
+                record(qso)
+        else:
+            for f in args.file:
+                for qso in timings.iterate("parse", load_qsos(f, rules, args.cache, timings), "qsos"):
+                    record(qso)
+        for name, n in cache_stats.items():
+            timings.count("cache_" + name, n)
+
+        with timings.stage("process"):
+            scorer.process()
+        with timings.stage("render"):
+            scorer.display()
@@ -1,19 +1,222 @@
 import argparse
+import asyncio
+import bisect
+import collections
 import datetime
-import os.path
+import os
+import re
+import sys
+import threading
 
 from contextlib import closing
 
-from hamutils.adif.adi import ADIReader, ADIWriter
+from adifstream import ADIStreamReader, ADIStreamWriter
+from timings import NO_TIMINGS, add_timing_arguments, instrument
 
 
 DEFAULT_DATE = datetime.datetime.utcnow().date()
 DEFAULT_BAND = "20m"
 DEFAULT_MODE = "CW"
 
+END_TAG_RE = re.compile(rb"<eo[rh](?::[^>]*)?>", re.IGNORECASE)
+# the name of every tag, including one cut off before its ">"
+TAG_NAME_RE = re.compile(rb"<([^:>]*)")
+TAIL_SIZE = 1 << 16
+
+
+def _append_offset(f):
+    # Offset just past the last <eor> (or the <eoh> of a log without
+    # records) and the whitespace after it. The file is scanned backwards a
+    # block at a time, so this normally reads only its tail. None if the
+    # file has no such tag.
+    end = f.seek(0, os.SEEK_END)
+    block_end = end
+    while block_end > 0:
+        start = max(0, block_end - TAIL_SIZE)
+        f.seek(start)
+        # overlap the next block so a tag split across blocks is still seen
+        data = f.read(block_end + 16 - start)
+        last = None
+        for last in END_TAG_RE.finditer(data):
+            pass
+        if last is not None:
+            offset = start + last.end()
+            f.seek(offset)
+            rest = f.read()
+            return offset + len(rest) - len(rest.lstrip())
+        block_end = start
+    return None
+
+
+class AppendWriter(ADIStreamWriter):
+    # Writes batches of records in front of the trailer found after the
+    # last record, which is written again behind each batch. Readers stop
+    # at LoTW's <APP_LoTW_EOF>, so records after it would be lost to them.
+
+    def __init__(self, f, trailer=b"", header=True):
+        super().__init__(f, "simplelogger.py", 0.1, header=header)
+        self._trailer = trailer
+
+    def add_qsos(self, records):
+        if self._trailer:
+            self._flo.flush()
+            self._flo.truncate(self._flo.seek(0, os.SEEK_END) - len(self._trailer))
+        for fields in records:
+            self.add_qso(**fields)
+        if self._trailer:
+            self._flo.write(self._trailer)
+
+
+def append_writer(f):
+    # A writer appending to a log opened with "a+b", without reading or
+    # rewriting the QSOs already in it. An incomplete record left behind by
+    # a crash is cut off; a trailer of app_ fields after the last record,
+    # like LoTW's <APP_LoTW_EOF>, stays at the end. A new or empty log gets
+    # a header.
+    offset = _append_offset(f)
+    header = offset is None
+    if header:
+        f.seek(0)
+        if f.read().strip():
+            raise RuntimeError(f"{f.name}: not an ADIF log (no <eoh> or <eor> found)")
+        offset = 0
+    trailer = b""
+    end = f.seek(0, os.SEEK_END)
+    if end > offset:
+        f.seek(offset)
+        trailer = f.read()
+        if any(not name.lower().startswith(b"app_") for name in TAG_NAME_RE.findall(trailer)):
+            print(f"Dropping incomplete record at the end of {f.name} ({end - offset} bytes)")
+            f.truncate(offset)
+            trailer = b""
+    return AppendWriter(f, trailer, header=header)
+
+
+class QSOIndex:
+    # The band/mode pairs each call was worked on, for dupe and
+    # worked-before checks, and a sorted list of "suffix call" strings
+    # holding every suffix of every call. All calls containing a fragment
+    # (super check partial) are then one contiguous run found by bisect.
+
+    def __init__(self):
+        self._worked = collections.defaultdict(set)
+        self._suffixes = []
+
+    @staticmethod
+    def _key(band, mode):
+        return band.lower(), mode.upper()
+
+    @staticmethod
+    def _call_suffixes(call):
+        return [f"{call[i:]} {call}" for i in range(len(call))]
+
+    @classmethod
+    def from_records(cls, records):
+        index = cls()
+        for record in records:
+            index._worked[record["call"].upper()].add(cls._key(record["band"], record["mode"]))
+        index._suffixes = sorted(suffix for call in index._worked for suffix in cls._call_suffixes(call))
+        return index
+
+    @classmethod
+    def from_log(cls, path):
+        with open(path) as f:
+            return cls.from_records(ADIStreamReader(f))
+
+    def add(self, call, band, mode):
+        call = call.upper()
+        if call not in self._worked:
+            for suffix in self._call_suffixes(call):
+                bisect.insort(self._suffixes, suffix)
+        self._worked[call].add(self._key(band, mode))
+
+    def is_dupe(self, call, band, mode):
+        return self._key(band, mode) in self._worked.get(call.upper(), ())
+
+    def worked(self, call):
+        return sorted(self._worked.get(call.upper(), ()))
+
+    def partial(self, fragment, limit=20):
+        fragment = fragment.upper()
+        calls = {}
+        i = bisect.bisect_left(self._suffixes, fragment)
+        while i < len(self._suffixes) and self._suffixes[i].startswith(fragment) and len(calls) < limit:
+            calls[self._suffixes[i].split(" ", 1)[1]] = None
+            i += 1
+        return sorted(calls)
+
+    def __len__(self):
+        return len(self._worked)
+
+
+class BackgroundWriter:
+    # Confirmed QSOs are queued and written by a background task, so the
+    # prompt never waits for the disk. The task takes everything queued so
+    # far as one batch and writes it on a worker thread with a single
+    # flush and fsync; QSOs confirmed meanwhile make up the next batch.
+
+    def __init__(self, adif, f, max_batch=100, timings=NO_TIMINGS):
+        self._adif = adif
+        self._f = f
+        self._max_batch = max_batch
+        self._timings = timings
+        self._queue = asyncio.Queue()
+
+    def put(self, fields):
+        self._queue.put_nowait(fields)
+
+    def close(self):
+        self._queue.put_nowait(None)
+
+    def _write(self, batch):
+        with self._timings.stage("write"):
+            self._adif.add_qsos(batch)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+        self._timings.count("batches")
+
+    async def run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty() and len(batch) < self._max_batch:
+                batch.append(self._queue.get_nowait())
+            done = None in batch
+            batch = [fields for fields in batch if fields is not None]
+            if batch:
+                await asyncio.to_thread(self._write, batch)
+            if done:
+                return
+
+
+async def run_in_daemon_thread(func):
+    # input() can't be interrupted, so a prompt blocked in it must not
+    # hold up interpreter exit the way an executor thread would
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, exception):
+        if future.done():
+            return
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
+
+    def run():
+        try:
+            result = func()
+        except BaseException as ex:
+            loop.call_soon_threadsafe(settle, None, ex)
+        else:
+            loop.call_soon_threadsafe(settle, result, None)
+
+    threading.Thread(target=run, daemon=True).start()
+    return await future
+
 
 class LogRecord:
-    def __init__(self, station_callsign=None, operator=None):
+    def __init__(self, station_callsign=None, operator=None, index=None):
+        self._index = index
         self._fields = {}
         if station_callsign:
             self._fields["station_callsign"] = station_callsign
@@ -81,11 +284,20 @@ class LogRecord:
         self._fields["datetime_on"] = dt
 
     def prompt_call(self):
+        # "K1A?" lists the logged calls containing K1A
         call = ''
-        while call == '':
+        while call == '' or call.endswith('?'):
+            if call.endswith('?') and self._index is not None:
+                print("SCP:", " ".join(self._index.partial(call[:-1])) or "-")
             call = input("CALL: ").upper()
         self._fields["call"] = call
 
+        if self._index is not None:
+            if self._index.is_dupe(call, self._fields["band"], self._fields["mode"]):
+                print(f"*** DUPE: {call} already worked on {self._fields['band']} {self._fields['mode']} ***")
+            elif self._index.worked(call):
+                print("Worked before:", ", ".join(f"{band} {mode}" for band, mode in self._index.worked(call)))
+
     def prompt_rst(self):
         if DEFAULT_MODE == "CW":
             rst_rcvd = "599"
@@ -119,28 +331,47 @@ class LogRecord:
         return inp
 
 
+async def amain(args, timings=NO_TIMINGS):
+    with open(args.output, "a+b") as f, closing(append_writer(f)) as adif:
+        f.flush()
+        with timings.stage("index"):
+            index = QSOIndex.from_log(args.output) if f.seek(0, os.SEEK_END) else QSOIndex()
+        timings.count("indexed_calls", len(index))
+        writer = BackgroundWriter(adif, f, timings=timings)
+        writer_task = asyncio.create_task(writer.run())
+        try:
+            while True:
+                record = LogRecord(args.station_callsign, args.operator, index)
+                try:
+                    await run_in_daemon_thread(record.prompt_all)
+                except EOFError:
+                    break
+                if writer_task.done():
+                    # surfaces a failed write instead of queueing behind it
+                    writer_task.result()
+                writer.put(record.fields)
+                timings.count("qsos")
+                index.add(record.fields["call"], record.fields["band"], record.fields["mode"])
+        finally:
+            writer.close()
+            await writer_task
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--station-callsign", required=True)
     parser.add_argument("--operator")
     parser.add_argument("-o", "--output", required=True)
+    add_timing_arguments(parser)
     args = parser.parse_args()
 
-    oldqsos = []
-
-    if os.path.exists(args.output):
-        with open(args.output, "r") as f:
-            adif = ADIReader(f)
-            oldqsos.extend((qso for qso in adif))
-
-    with open(args.output, "wb") as f:
-        with closing(ADIWriter(f, "simplelogger.py", 0.1)) as adif:
-            try:
-                for qso in oldqsos:
-                    adif.add_qso(**qso)
-                while True:
-                    record = LogRecord(args.station_callsign, args.operator)
-                    record.prompt_all()
-                    adif.add_qso(**record.fields)
-            except EOFError:
-                pass
+    try:
+        with instrument(args) as timings:
+            asyncio.run(amain(args, timings))
+    except KeyboardInterrupt:
+        # The log is written and closed by now, but the prompt thread can
+        # still be blocked reading stdin, holding a lock the interpreter
+        # can't shut down with. Leave without that shutdown.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(130)
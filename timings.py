@@ -0,0 +1,144 @@
+import contextlib
+import cProfile
+import collections
+import json
+import os
+import sys
+import time
+
+
+class Timings:
+    # Wall-clock seconds per named stage plus event counters for one run.
+    # Stages can nest or overlap (concurrent network requests each add
+    # their own time), so they needn't add up to the elapsed total.
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.stages = collections.defaultdict(float)
+        self.calls = collections.Counter()
+        self.counts = collections.Counter()
+
+    def add(self, name, seconds, calls=1):
+        self.stages[name] += seconds
+        self.calls[name] += calls
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def wrap(self, name, func):
+        # func, with every call timed as the stage name
+        clock = time.perf_counter
+        stages = self.stages
+        calls = self.calls
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stages[name] += clock() - start
+                calls[name] += 1
+        return timed
+
+    def iterate(self, name, iterable, count=None):
+        # the items of iterable, with the time spent producing them timed
+        # as the stage name and their number added to the counter count
+        clock = time.perf_counter
+        it = iter(iterable)
+        elapsed = 0.0
+        n = 0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += clock() - start
+                n += 1
+                yield item
+        finally:
+            self.add(name, elapsed)
+            if count is not None:
+                self.counts[count] += n
+
+    def summary(self):
+        elapsed = time.perf_counter() - self._start
+        return {
+            "tool": os.path.basename(sys.argv[0]),
+            "elapsed": elapsed,
+            "stages": {name: {"seconds": seconds, "calls": self.calls[name]} for name, seconds in self.stages.items()},
+            "counts": dict(self.counts),
+            "per_second": {name: n / elapsed for name, n in self.counts.items()} if elapsed else {},
+        }
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        summary = self.summary()
+        elapsed = summary["elapsed"]
+        print(f"TIMINGS ({elapsed:.3f}s elapsed)", file=file)
+        for name, stage in summary["stages"].items():
+            share = 100 * stage["seconds"] / elapsed if elapsed else 0
+            print(f"  {name:<16} {stage['seconds']:>10.3f}s {share:>6.1f}% {stage['calls']:>10} calls", file=file)
+        for name, n in summary["counts"].items():
+            print(f"  {name:<16} {n:>11} {summary['per_second'][name]:>12.1f}/s", file=file)
+
+
+class _NoTimings:
+    # Stands in for Timings when nothing is measured, at no cost per call.
+
+    def add(self, name, seconds, calls=1):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def wrap(self, name, func):
+        return func
+
+    def iterate(self, name, iterable, count=None):
+        return iterable
+
+
+NO_TIMINGS = _NoTimings()
+
+
+def add_timing_arguments(parser):
+    parser.add_argument("--timings", action="store_true")
+    parser.add_argument("--timings-json")
+    parser.add_argument("--profile")
+
+
+@contextlib.contextmanager
+def instrument(args):
+    # The Timings for a CLI run, set up from the add_timing_arguments()
+    # options: --timings prints a report to stderr and --timings-json writes
+    # the summary to a file once the run ends; --profile runs everything
+    # under cProfile and dumps the stats to a file for pstats or snakeviz.
+    timings = Timings() if args.timings or args.timings_json else NO_TIMINGS
+    profile = cProfile.Profile() if args.profile else None
+    if profile is not None:
+        profile.enable()
+    try:
+        yield timings
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(args.profile)
+        if args.timings:
+            timings.report()
+        if args.timings_json:
+            with open(args.timings_json, "w") as f:
+                json.dump(timings.summary(), f, indent=2)